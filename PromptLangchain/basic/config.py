@@ -13,7 +13,6 @@ import os
 import logging
 import time
 import uuid
-import re
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 
@@ -41,6 +40,14 @@ FREQUENCY_PENALTY = 0.0
 # 存在惩罚
 PRESENCE_PENALTY = 0.0
 
+# 并发控制
+# 同时调用大模型的请求数
+MAX_CONCURRENT_REQUESTS = 32
+# 等待调用名额的请求数上限，超过后直接返回 429
+MAX_PENDING_REQUESTS = 128
+# 等待调用名额的超时时间（秒），超时返回 503
+REQUEST_QUEUE_TIMEOUT = 30
+
 # API配置
 LOCAL_API_KEY = os.getenv("LOCAL_API_KEY")
 LOCAL_API_BASE = os.getenv("LOCAL_API_BASE")
@@ -111,33 +118,140 @@ def get_prompt(prompt: str):
     return prompt
 
 
+# 代码块标记
+CODE_FENCE = "```"
+
+
+# 流式格式化，逐字符处理模型输出的增量文本，边接收边输出，每个字符只处理常数次
+# 格式化规则：
+# 1. 代码块外，包含两个连续换行符的空白视为段落分隔，统一为两个换行符；句点后面的空格替换为换行符；全文首尾空白去掉
+# 2. 代码块单独成行，语言标识保留在开头的 ``` 之后，代码内容原样输出（包括空行），只去掉首尾空白，未闭合的代码块在结束时补全
+# 无法确定如何输出的空白和反引号先缓存，各次 feed 与 flush 的输出拼接后与一次性格式化的结果完全一致，与文本如何切分无关
+class StreamFormatter:
+    def __init__(self):
+        # 本次待返回的输出
+        self._output = []
+        # 尚未输出的连续反引号数
+        self._ticks = 0
+        # 尚未输出的连续空白
+        self._space = []
+        # 是否在代码块中
+        self._in_fence = False
+        # 代码块开头行（语言标识），读完开头行后为 None
+        self._info = None
+        # 代码块内容是否已经开始输出
+        self._body_started = False
+        # 是否已经输出过内容
+        self._started = False
+        # 是否位于段落开头
+        self._paragraph_start = True
+        # 代码块外最后输出的字符
+        self._last = ""
+
+    # 输入增量文本，返回本次可以输出的格式化文本
+    def feed(self, delta: str) -> str:
+        for char in delta:
+            if char == "`":
+                self._ticks += 1
+                if self._ticks == len(CODE_FENCE):
+                    self._ticks = 0
+                    self._fence()
+                continue
+            self._flush_ticks()
+            self._char(char)
+        return self._take()
+
+    # 输入结束，返回剩余的格式化文本，之后可以继续格式化新的文本
+    def flush(self) -> str:
+        self._flush_ticks()
+        if self._in_fence:
+            # 补全未闭合的代码块
+            self._fence()
+        output = self._take()
+        self.__init__()
+        return output
+
+    def _take(self):
+        output = ''.join(self._output)
+        self._output.clear()
+        return output
+
+    # 不足三个的反引号按普通字符处理
+    def _flush_ticks(self):
+        ticks, self._ticks = self._ticks, 0
+        for _ in range(ticks):
+            self._char("`")
+
+    def _char(self, char):
+        if self._in_fence and self._info is not None:
+            # 代码块开头行
+            if char == "\n":
+                self._output.append(''.join(self._info).strip() + "\n")
+                self._info = None
+            else:
+                self._info.append(char)
+        elif self._in_fence:
+            # 代码内容，去掉开头的空白，中间的空白在遇到下一个非空白字符时原样输出
+            if char.isspace():
+                if self._body_started:
+                    self._space.append(char)
+            else:
+                self._output.extend(self._space)
+                self._space.clear()
+                self._output.append(char)
+                self._body_started = True
+        elif char.isspace():
+            self._space.append(char)
+        else:
+            self._output.append(self._resolve_space())
+            self._output.append(char)
+            self._started = True
+            self._paragraph_start = False
+            self._last = char
+
+    # 遇到非空白内容时，确定之前缓存的空白如何输出
+    def _resolve_space(self):
+        space = ''.join(self._space)
+        self._space.clear()
+        if not self._started:
+            return ""
+        if "\n\n" in space:
+            self._paragraph_start = True
+            return "\n\n"
+        if self._last == "." and space.startswith(" "):
+            return "\n" + space[1:]
+        return space
+
+    # 遇到代码块标记，开始或结束代码块
+    def _fence(self):
+        if not self._in_fence:
+            self._output.append(self._resolve_space())
+            if not self._paragraph_start:
+                self._output.append("\n")
+            self._output.append(CODE_FENCE)
+            self._in_fence = True
+            self._info = []
+            self._body_started = False
+            self._started = True
+            self._paragraph_start = False
+            return
+        if self._info is not None:
+            # 开头行还没有结束，代码块就闭合了，开头行的内容即为代码
+            self._output.append("\n" + ''.join(self._info).strip())
+            self._info = None
+        # 去掉代码末尾的空白
+        self._space.clear()
+        self._output.append("\n" + CODE_FENCE)
+        self._in_fence = False
+        # 代码块后换行，与后续的空白一起确定如何输出
+        self._space.append("\n")
+        self._last = CODE_FENCE[-1]
+
+
 # 格式化输出，对输出的响应进行段落分割，添加换行符，以及在代码模块中增加，增加输出的可读性
 def format_response(response: str):
-    # 使用正则表达式 \n{2, }将输入的response按照两个或更多的连续换行符进行分割。这样可以将文本分割成多个段落，每个段落由连续的非空行组成
-    response = str(response)
-    paragraphs = re.split(r'\n{2,}', response)
-    # 空列表，用语存储格式化后输出
-    formatted_paragraphs = []
-    # 遍历每个段落进行处理
-    for para in paragraphs:
-        # 检查段落中是否包含代码块标记
-        if '```' in para:
-            # 将段落按照```分割成多个部分，代码块和文本交替出现
-            parts = re.split(r'```', para)
-            for i, part in enumerate(parts):
-                # 奇数为代码块
-                if i % 2 != 0:
-                    parts[i] = f"\n```\n{part.strip()}\n```\n"
-            para = ''.join(parts)
-            
-        else:
-            # 否则，将句子中的句点后面的空格替换为换行符，以便句子之间有明确的分隔
-            para = para.replace(r'. ', '.\n')
-        # 将格式化后的段落添加到formatted_paragraphs列表
-        # strip()方法用于移除字符串开头和结尾的空白字符（包括空格、制表符 \t、换行符 \n等）
-        formatted_paragraphs.append(para.strip())
-    # 将所有格式化后的段落用两个换行符连接起来，以形成一个具有清晰段落分隔的文本
-    return '\n\n'.join(formatted_paragraphs)
+    formatter = StreamFormatter()
+    return formatter.feed(str(response)) + formatter.flush()
 
 
 if __name__ == "__main__":
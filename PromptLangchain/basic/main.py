@@ -23,9 +23,11 @@ from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
 # 部署REST API相关
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import uvicorn
 from config import MODEL_NAME, TEMPERATURE, MAX_TOKENS, FREQUENCY_PENALTY, PRESENCE_PENALTY, PORT, PROMPT_TEMPLATE_SYSTEM, PROMPT_TEMPLATE_USER
-from config import logger, get_prompt, get_model_config, format_response, ChatCompletionRequest, ChatComplationResponseChoice, ChatCompletionResponse, Messages
+from config import MAX_CONCURRENT_REQUESTS, MAX_PENDING_REQUESTS, REQUEST_QUEUE_TIMEOUT
+from config import logger, get_prompt, get_model_config, format_response, StreamFormatter, ChatCompletionRequest, ChatComplationResponseChoice, ChatCompletionResponse, Messages
 
 
 # 在文件开头添加环境变量设置
@@ -35,6 +37,9 @@ os.environ["LANGCHAIN_TRACING_V2"] = "false"
 model = None
 prompt = None
 chain = None
+# 并发控制：信号量限制同时调用大模型的请求数，pending_requests 记录等待名额的请求数
+request_semaphore = None
+pending_requests = 0
 
 
 # 定义了一个异步函数lifespan，它接收一个FastAPI应用实例app作为参数。这个函数将管理应用的生命周期，包括启动和关闭时的操作
@@ -45,7 +50,7 @@ chain = None
 async def lifespan(app: FastAPI):
     # 在执行时启动
     # 申明引用全局变量
-    global model, prompt, chain
+    global model, prompt, chain, request_semaphore
     # 获得模型基础配置
     api_key, base_url = get_model_config(MODEL_NAME)
     # 根据自己实际情况选择调用model和embedding模型类型
@@ -70,6 +75,8 @@ async def lifespan(app: FastAPI):
         )
         # 定义chain
         chain = prompt | get_prompt | model
+        # 初始化并发控制
+        request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
         # 初始化完成日志打印
         logger.info(f"模型初始化完成")
         
@@ -85,6 +92,60 @@ async def lifespan(app: FastAPI):
     
 app = FastAPI(lifespan=lifespan)
 
+
+# 获取调用大模型的名额，实现并发限制和背压，返回释放名额的协程函数，重复调用只释放一次
+# 等待名额的请求过多时直接返回 429，等待超时返回 503，客户端据此退避重试，避免请求无限堆积
+async def acquire_request_slot():
+    global pending_requests
+    if pending_requests >= MAX_PENDING_REQUESTS:
+        logger.warning(f"等待中的请求过多: {pending_requests}")
+        raise HTTPException(status_code=429, detail="服务繁忙，请稍后重试", headers={"Retry-After": "1"})
+    pending_requests += 1
+    try:
+        await asyncio.wait_for(request_semaphore.acquire(), timeout=REQUEST_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"等待调用名额超时: {REQUEST_QUEUE_TIMEOUT}s")
+        raise HTTPException(status_code=503, detail="服务繁忙，请稍后重试", headers={"Retry-After": "5"})
+    finally:
+        pending_requests -= 1
+
+    released = False
+
+    async def release():
+        nonlocal released
+        if not released:
+            released = True
+            request_semaphore.release()
+    return release
+
+
+# 在名额内执行代码块
+@asynccontextmanager
+async def request_slot():
+    release = await acquire_request_slot()
+    try:
+        yield
+    finally:
+        await release()
+
+
+# 构建流式响应片段，按SSE格式以 data: 开头、空行结尾
+def build_stream_chunk(chunk_id: str, delta: dict, finish_reason: str = None):
+    chunk = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "choices": [
+            {
+                "index": 0,
+                "delta": delta,
+                "finish_reason": finish_reason
+            }
+        ]
+    }
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+
 # POST请求接口，与大模型进行知识问答
 @app.post("/v1/chat/completions")
 async def chat_completions(request: ChatCompletionRequest):
@@ -96,61 +157,51 @@ async def chat_completions(request: ChatCompletionRequest):
         logger.info(f"收到聊天完成请求: {request}")
         query_prompt = request.messages[-1].content
         logger.info(f"用户的问题是: {query_prompt}")
-        # 调用chain进行推理
-        result = chain.invoke({"query": query_prompt})
-        if not isinstance(result, str):
-            result = str(result)
-        # 对响应进行格式化
-        formatted_response = str(format_response(result))
-        logger.info(f"格式化的模型推理结果: {formatted_response}")
-        
         # 处理流式响应
         if request.stream:
-            # 定义一个异步生成器函数，用于生成流式数据
+            # 在返回响应之前获取名额，繁忙时仍能返回 429/503 状态码
+            release = await acquire_request_slot()
+
+            # 定义一个异步生成器函数，模型每输出一段文本，格式化后立即发送
             async def generate_stream():
                 # 为每个流式片段生成一个唯一的chunk_id
                 chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
-                # 将格式化的响应分割
-                lines = formatted_response.split('\n')
-                # 遍历每一行，并构建响应片段
-                for i, line in enumerate(lines):
-                    # 创建一个字典，表示流式响应片段
-                    chunk = {
-                        "id": chunk_id,
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {"content": line + '\n'},
-                                "finish_reason": None
-                            }
-                        ]
-                    }
-                    # 将片段转换为json格式并生成
-                    yield f"{json.dumps(chunk)}\n"
-                    # 每次生成数据后，等待0.5秒
-                    await asyncio.sleep(0.5)
-                # 生成最后一个片段，表示流式响应结束
-                final_chunk = {
-                    "id": chunk_id,
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "choices": [
-                        {
-                            "index": 0,
-                            "delta": {},
-                            "finish_reason": "stop"
-                        }
-                    ]
-                }
-                # 将最后一个片段转换为json格式并生成
-                yield f"{json.dumps(final_chunk)}\n"
+                formatter = StreamFormatter()
+                try:
+                    async for message_chunk in chain.astream({"query": query_prompt}):
+                        content = formatter.feed(getattr(message_chunk, "content", message_chunk) or "")
+                        if content:
+                            yield build_stream_chunk(chunk_id, {"content": content})
+                    content = formatter.flush()
+                    if content:
+                        yield build_stream_chunk(chunk_id, {"content": content})
+                    # 生成最后一个片段，表示流式响应结束
+                    yield build_stream_chunk(chunk_id, {}, finish_reason="stop")
+                except Exception as e:
+                    # 响应头已经发送，只能在流中返回错误信息
+                    logger.error(f"流式输出时出错: \n\n {str(e)}")
+                    yield f"data: {json.dumps({'error': {'message': str(e)}}, ensure_ascii=False)}\n\n"
+                finally:
+                    await release()
+                # 结束标记
+                yield "data: [DONE]\n\n"
             # 返回fastapi.responses中StreamingResponse对象，流式传输数据
             # media_type设置为text/event-stream以符合SSE(Server-SentEvents) 格式
-            return StreamingResponse(generate_stream(), media_type="text/event-stream")
+            # 客户端在生成器启动前断开时生成器不会执行，由后台任务兜底释放名额
+            return StreamingResponse(generate_stream(), media_type="text/event-stream", background=BackgroundTask(release))
         
         else:
+            # 调用chain进行异步推理，等待模型响应时不阻塞事件循环
+            async with request_slot():
+                result = await chain.ainvoke({"query": query_prompt})
+            # chain 的输出是 AIMessage，取其文本内容
+            result = getattr(result, "content", result)
+            if not isinstance(result, str):
+                result = str(result)
+            # 对响应进行格式化
+            formatted_response = str(format_response(result))
+            logger.info(f"格式化的模型推理结果: {formatted_response}")
+
             # 非流式响应
             response = ChatCompletionResponse(
                 choices=[
@@ -165,6 +216,8 @@ async def chat_completions(request: ChatCompletionRequest):
             # 返回fastapi.responses中JSONResponse对象
             # model_dump()方法通常用于将Pydantic模型实例的内容转换为一个标准的Python字典，以便进行序列化
             return JSONResponse(content=response.model_dump())
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"处理聊天完成时出错: \n\n {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
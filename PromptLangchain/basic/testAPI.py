@@ -54,16 +54,26 @@ if __name__ == "__main__":
             with requests.post(url, headers=headers, data=json.dumps(data), stream=True) as response:
                 for line in response.iter_lines():
                     if line:
-                        json_str = line.decode('utf-8').strip("data: ")
+                        line = line.decode('utf-8').strip()
+                        # SSE格式，每个片段以 data: 开头
+                        if not line.startswith("data:"):
+                            continue
+                        json_str = line[len("data:"):].strip()
                         # 检查是否为空或不合法的字符串
                         if not json_str:
                             logger.info(f"收到空字符串，跳过...")
                             continue
+                        # 结束标记
+                        if json_str == "[DONE]":
+                            logger.info(f"收到结束标记，停止输出...")
+                            break
                         # 确保字符串是有效的JSON格式
                         if json_str.startswith("{") and json_str.endswith("}"):
                             try:
                                 json_data = json.loads(json_str)
-                                if json_data['choices'][0]['finish_reason'] == 'stop':
+                                if 'error' in json_data:
+                                    logger.error(f"服务端出错: {json_data['error']['message']}")
+                                elif json_data['choices'][0]['finish_reason'] == 'stop':
                                     logger.info(f"收到终止信号，停止输出...")
                                 else:
                                     logger.info(f"流式输出，响应内容是：{json_data['choices'][0]['delta']['content']}")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-28 20:15
+# @Desc   : 流式格式化测试，可直接运行或使用 pytest 运行
+# --------------------------------------------------------
+"""
+import random
+import time
+
+from config import StreamFormatter, format_response
+
+
+# 按给定的切分位置流式格式化
+def stream_format(text, cuts):
+    formatter = StreamFormatter()
+    output = []
+    start = 0
+    for end in sorted(cuts) + [len(text)]:
+        output.append(formatter.feed(text[start:end]))
+        start = end
+    output.append(formatter.flush())
+    return ''.join(output)
+
+
+def test_empty():
+    assert format_response("") == ""
+    assert format_response(" \n\n ") == ""
+
+
+def test_strip_and_paragraphs():
+    assert format_response("  第一段  \n\n\n  第二段\n") == "第一段\n\n第二段"
+    # 中间不是连续换行符时不分段
+    assert format_response("a\n \nb") == "a\n \nb"
+    assert format_response("a\nb") == "a\nb"
+
+
+def test_sentence_break():
+    assert format_response("First. Second. Third") == "First.\nSecond.\nThird"
+    assert format_response("End. \n\nNext") == "End.\n\nNext"
+    assert format_response("v1.2 is out") == "v1.2 is out"
+
+
+def test_code_fence():
+    text = "示例如下：\n\n```python\nx = 1. \n\n\ny = 2\n```\n\n说明. 完毕"
+    expected = "示例如下：\n\n```python\nx = 1. \n\n\ny = 2\n```\n\n说明.\n完毕"
+    assert format_response(text) == expected
+
+
+def test_inline_fence():
+    assert format_response("use ```x``` here") == "use \n```\nx\n```\n here"
+    assert format_response("```a``````b```") == "```\na\n```\n\n```\nb\n```"
+
+
+def test_unclosed_fence():
+    assert format_response("代码：\n\n```sh\nls -l  \n") == "代码：\n\n```sh\nls -l\n```"
+    assert format_response("```") == "```\n\n```"
+
+
+def test_backticks():
+    assert format_response("a `b` c") == "a `b` c"
+    assert format_response("x `` y") == "x `` y"
+    assert format_response("````") == "```\n`\n```"
+
+
+def test_streaming_emits_before_paragraph_end():
+    formatter = StreamFormatter()
+    assert formatter.feed("hello wor") == "hello wor"
+    # 末尾的空白要等到后续文本才能确定是否为段落分隔
+    assert formatter.feed("ld\n") == "ld"
+    assert formatter.feed("\nnext") == "\n\nnext"
+    assert formatter.flush() == ""
+
+
+def test_fence_split_across_deltas():
+    formatter = StreamFormatter()
+    output = formatter.feed("a `")
+    output += formatter.feed("`")
+    output += formatter.feed("`py\nprint(1)\n`")
+    output += formatter.feed("``\nb")
+    output += formatter.flush()
+    assert output == "a \n```py\nprint(1)\n```\n\nb"
+
+
+def test_formatter_reusable_after_flush():
+    formatter = StreamFormatter()
+    formatter.feed("```open")
+    formatter.flush()
+    assert formatter.feed(" a. b ") + formatter.flush() == "a.\nb"
+
+
+def test_random_split_invariance():
+    rng = random.Random(0)
+    alphabet = ["a", "中", ".", " ", "\n", "\t", "`", "```", "```py\n", ". ", "\n\n"]
+    for _ in range(2000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        expected = format_response(text)
+        cuts = rng.sample(range(len(text) + 1), rng.randint(0, len(text)))
+        assert stream_format(text, cuts) == expected, repr(text)
+        # 逐字符输入
+        assert stream_format(text, list(range(len(text)))) == expected, repr(text)
+
+
+def test_linear_time():
+    # 每个字符只处理常数次，耗时随长度线性增长
+    def elapsed(size):
+        text = ("word. " * 20 + "\n\n```\ncode\n\n```\n\n" + " " * 50) * size
+        formatter = StreamFormatter()
+        start = time.perf_counter()
+        for i in range(0, len(text), 3):
+            formatter.feed(text[i:i + 3])
+        formatter.flush()
+        return time.perf_counter() - start
+    small, large = elapsed(200), elapsed(2000)
+    assert large < small * 30
+
+
+if __name__ == "__main__":
+    # 测试
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name} 通过")
@@ -10,7 +10,7 @@
 # --------------------------------------------------------
 """
 import gradio as gr
-from config import MODELS, DEFAULT_MODEL, MODEL_TO_MAX_TOKENS
+from config import MODELS, DEFAULT_MODEL, MODEL_TO_MAX_TOKENS, GRADIO_CONCURRENCY_LIMIT
 from kk_GPT import kk_GPT
 import logging
 from dotenv import load_dotenv
@@ -72,12 +72,14 @@ def fn_prehandle_user_input(user_input, chat_history):
 
 
 
-def fn_predict(user_input, chat_history, model, temperature, max_tokens, stream):
+async def fn_predict(user_input, chat_history, model, temperature, max_tokens, stream):
     """
     预测用户输入
+    异步生成器，等待模型输出时不占用工作线程
     """
     if not user_input:
-        return chat_history
+        yield chat_history
+        return
     
     logger.info(f"用户输入：{user_input}, \n"
                 f"聊天历史：{chat_history}, \n"
@@ -103,7 +105,7 @@ def fn_predict(user_input, chat_history, model, temperature, max_tokens, stream)
     logger.info(f"构建的messages参数：{messages}")
     
     # 生成回复
-    bot_response = kk_gpt.get_complations(
+    bot_response = await kk_gpt.aget_complations(
         messages=messages,
         model=model,
         temperature=temperature,
@@ -114,7 +116,7 @@ def fn_predict(user_input, chat_history, model, temperature, max_tokens, stream)
     if stream:
         # 流式输出
         chat_history[-1][1] = ""
-        for character in bot_response:
+        async for character in bot_response:
             character_content = character.choices[0].delta.content
             if character_content is not None:
                 chat_history[-1][1] += character_content
@@ -209,4 +211,4 @@ with gr.Blocks() as demo:
     
 
 if __name__ == "__main__":
-    demo.queue().launch()
\ No newline at end of file
+    demo.queue(default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT).launch()
\ No newline at end of file
@@ -10,8 +10,8 @@
 """
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
 import logging
+from llm_client import get_llm_client, get_async_llm_client, get_provider_semaphore
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -27,7 +27,9 @@ class kk_GPT:
         """
         初始化GPT模型接口
         """
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.client = get_llm_client(base_url, api_key)
         
     def get_complations(self,
                         messages,
@@ -88,6 +90,83 @@ class kk_GPT:
         except Exception as e:
             logger.error(f"获取向量表示失败: {e}")
             return e
+    
+    async def aget_complations(self,
+                               messages,
+                               model,
+                               max_tokens=200,
+                               temperature=0.0,
+                               stream=False,
+                               ):
+        """
+        get_complations 的异步版本，同一服务同时进行的请求数受信号量限制
+
+        Args:
+            messages (list): 对话内容
+            model (str): 模型名称
+            max_tokes (int, optional): 返回的最大token数. Defaults to 200.
+            temperature (float, optional): 温度. Defaults to 0.0.
+            stream (bool, optional): 是否流式返回，为 True 时返回异步生成器. Defaults to False.
+        """
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        elif not isinstance(messages, list):
+            logger.error("messages must be a string or a list")
+            return ValueError("messages must be a string or a list")
+        
+        if stream:
+            # 流式输出，信号量在整个输出期间占用
+            return self._astream_complations(messages, model, max_tokens, temperature)
+        try:
+            async with get_provider_semaphore(self.base_url):
+                response = await get_async_llm_client(self.base_url, self.api_key).chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=False,
+                )
+            logger.info(f"获取对话响应成功: {response.choices[0].message.content}")
+            logger.info(f"总token数: {response.usage.total_tokens}")
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"获取对话响应失败: {e}")
+            return e
+    
+    async def _astream_complations(self, messages, model, max_tokens, temperature):
+        """
+        流式输出的异步生成器
+        """
+        async with get_provider_semaphore(self.base_url):
+            response = await get_async_llm_client(self.base_url, self.api_key).chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+            )
+            async for chunk in response:
+                yield chunk
+    
+    async def aget_embeddings(self, input):
+        """
+        get_embeddings 的异步版本
+
+        Args:
+            input (str): 输入文本
+        """
+        try:
+            async with get_provider_semaphore(self.base_url):
+                embeddings = await get_async_llm_client(self.base_url, self.api_key).embeddings.create(
+                    input=input,
+                    model="text-embedding-3-small",
+                    dimensions=1536,
+                    encoding_format="base64",
+                )
+            return embeddings
+        except Exception as e:
+            logger.error(f"获取向量表示失败: {e}")
+            return e
 
 
 if __name__ == "__main__":
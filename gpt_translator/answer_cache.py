@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-25 20:10
+# @Desc   : 文档问答的语义答案缓存，相同文档集合下语义相近的问题直接返回已有答案
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from config import (
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_STREAM_CHUNK_SIZE,
+)
+
+
+def make_scope(model: str, file_digests: List[str]) -> Tuple:
+    """
+    缓存范围：模型 + 排序后的文件摘要集合，文件内容变化后摘要变化，旧答案自然不再命中
+    """
+    return model, tuple(sorted(set(file_digests)))
+
+
+def iter_answer_chunks(answer: str, chunk_size: int = ANSWER_CACHE_STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """
+    将缓存的答案切成小段，按流式输出的方式逐段返回
+    """
+    for start in range(0, len(answer), chunk_size):
+        yield answer[start:start + chunk_size]
+
+
+class AnswerCache:
+    """
+    进程内缓存，按范围分组保存 (问题向量, 答案)。
+    查询时计算问题向量与同范围内各问题向量的余弦相似度，最高分不低于阈值且未过期时命中。
+    条目总数超过上限时淘汰最近最少使用的条目。
+    """
+    def __init__(self,
+                 threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: float = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # {条目id: (范围, 归一化问题向量, 答案, 写入时间)}，按访问顺序排列
+        self._entries = OrderedDict()
+        # {范围: [条目id]}
+        self._scopes = {}
+        self._next_id = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, scope: Tuple, question_vector: List[float]) -> Optional[str]:
+        """
+        查询缓存，未命中时返回 None
+        """
+        query = self._normalize(question_vector)
+        now = time.time()
+        with self._lock:
+            entry_ids = self._scopes.get(scope)
+            if not entry_ids:
+                return None
+            for entry_id in [entry_id for entry_id in entry_ids if now - self._entries[entry_id][3] > self.ttl]:
+                self._remove(entry_id)
+            entry_ids = self._scopes.get(scope)
+            if not entry_ids:
+                return None
+            scores = np.stack([self._entries[entry_id][1] for entry_id in entry_ids]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            entry_id = entry_ids[best]
+            self._entries.move_to_end(entry_id)
+            answer = self._entries[entry_id][2]
+        logger.success(f"答案缓存命中 | scope: {scope}, score: {scores[best]:.4f}")
+        return answer
+
+    def put(self, scope: Tuple, question_vector: List[float], answer: str) -> None:
+        """
+        写入缓存
+        """
+        if not answer:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, self._normalize(question_vector), answer, time.time())
+            self._scopes.setdefault(scope, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        """
+        删除条目，调用方需持有锁
+        """
+        scope = self._entries.pop(entry_id)[0]
+        entry_ids = self._scopes[scope]
+        entry_ids.remove(entry_id)
+        if not entry_ids:
+            del self._scopes[scope]
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    获取进程内共享的答案缓存
+    """
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
+
+
+if __name__ == "__main__":
+    # 测试
+    cache = get_answer_cache()
+    scope = make_scope("glm-4-plus", ["e41ab92c3f938ddb3e82110becbbce3e"])
+    cache.put(scope, [1.0, 0.0, 0.0], "这篇文章介绍了 LangChain 的整体架构。")
+    print(cache.get(scope, [0.99, 0.05, 0.0]))
+    print(cache.get(scope, [0.0, 1.0, 0.0]))
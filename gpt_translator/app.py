@@ -13,13 +13,20 @@ import sys
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(root_dir)
 
+import time
+import asyncio
 import gradio as gr
 import pandas as pd
 
 from config import MODELS, DEFAULT_MODEL, DEFAULT_MAX_TOKENS, MODEL_TO_MAX_TOKENS, API_KEY, BASE_URL
+from config import ANSWER_CACHE_ENABLED, ANSWER_CACHE_FIRST_TURN_ONLY, INGEST_POLL_INTERVAL, GRADIO_CONCURRENCY_LIMIT
 from kk_GPT import kk_GPT
-from file_processor_helper import FileProcessorHelper
-from utils import build_chat_document_prompt, upload_files
+from token_counter import count_tokens
+from vector_store import get_vector_store
+from answer_cache import get_answer_cache, iter_answer_chunks
+from utils import build_chat_document_prompt, get_question_vector, get_answer_cache_scope
+from ingest_jobs import get_ingest_job_manager, JOB_DONE
+from document_manifest import get_document_manifest
 from loguru import logger
 
 logger.remove() # 删去import logger之后自动产生的handler，不删除的话会出现重复输出的现象
@@ -67,7 +74,7 @@ def fn_prehandle_user_input(user_input, chat_history):
     return chat_history
 
 
-def fn_chat(
+async def fn_chat(
     chat_mode,
     uploaded_file_path_df,
     user_input,
@@ -80,10 +87,12 @@ def fn_chat(
 ):
     """
     聊天功能
+    异步生成器：模型输出通过异步客户端读取，不占用工作线程；检索等同步步骤放到线程中执行
     """
     # 如果用户输入为空，则返回当前的聊天记录
     if not user_input:
-        return chat_history
+        yield chat_history
+        return
     
     # 获取已上传文件的路径列表
     uploaded_file_path_list = uploaded_file_path_df['已上传的文件'].values.tolist()
@@ -102,6 +111,8 @@ def fn_chat(
     
     # 构建messages参数
     messages = []
+    answer_cache_scope = None
+    question_vector = None
     if chat_mode == "普通问答":
         messages = [
             {"role": "system", "content": "你是一个聊天机器人，请根据用户的问题进行回答。"},
@@ -121,14 +132,42 @@ def fn_chat(
         # 如果 uploaded_file_path_list 不是列表，或者是空列表，或者包含空字符串，则抛出错误
         if not isinstance(uploaded_file_path_list, list) or not uploaded_file_path_list or '' in uploaded_file_path_list:
             gr.Warning("请上传文件")
-            return chat_history
+            yield chat_history
+            return
         
-        user_prompt = build_chat_document_prompt(
-            uploaded_file_path_list,
-            user_input,
-            chat_history,
-            top_n_number
-        )
+        # 语义答案缓存：相同文档集合下语义相近的问题直接返回已有答案
+        question_vector = await asyncio.to_thread(get_question_vector, user_input)
+        if ANSWER_CACHE_ENABLED and question_vector is not None \
+                and (len(chat_history) <= 1 or not ANSWER_CACHE_FIRST_TURN_ONLY):
+            # 未登记的文件需要重新计算摘要，放到线程中执行
+            answer_cache_scope = await asyncio.to_thread(get_answer_cache_scope, uploaded_file_path_list, model)
+            cached_answer = get_answer_cache().get(answer_cache_scope, question_vector)
+            if cached_answer is not None:
+                if stream:
+                    # 与模型流式输出一样逐段返回
+                    chat_history[-1][1] = ""
+                    for piece in iter_answer_chunks(cached_answer):
+                        chat_history[-1][1] += piece
+                        yield chat_history
+                else:
+                    chat_history[-1][1] = cached_answer
+                    yield chat_history
+                logger.success(f"答案缓存 | bot_response: {chat_history[-1][1]}")
+                return
+        
+        # 问题向量化失败时不再构建 prompt，直接提示服务器错误
+        user_prompt = ''
+        if question_vector is not None:
+            user_prompt = await asyncio.to_thread(
+                build_chat_document_prompt,
+                uploaded_file_path_list,
+                user_input,
+                chat_history,
+                top_n_number,
+                model,
+                max_tokens,
+                question_vector
+            )
         if user_prompt:
             messages.append({"role": "user", "content": user_prompt})
         else:
@@ -139,20 +178,21 @@ def fn_chat(
     if not messages:
         logger.error(f"messages为空列表")
         gr.Warning("服务器错误")
-        return chat_history
+        yield chat_history
+        return
     else:
         # 打印 messages 参数
         logger.info(f"messages: {messages}")
         
         # messages有值，生成回复
         gpt = kk_GPT()
-        bot_response = gpt.get_completions(
+        bot_response = await gpt.aget_completions(
             messages, model, max_tokens, temperature, stream)
         
         if stream:
             # 流式输出
             chat_history[-1][1] = ""
-            for character in bot_response:
+            async for character in bot_response:
                 character_content = character.choices[0].delta.content
                 if character_content is not None:
                     chat_history[-1][1] += character_content
@@ -168,9 +208,9 @@ def fn_chat(
                             prompt += message['content'] + "\n"
                     logger.trace(f"prompt: {prompt}")
                     # prompt 的 token 数量
-                    prompt_tokens = FileProcessorHelper.tiktoken_len(prompt)
+                    prompt_tokens = count_tokens(prompt)
                     # completion 的 token 数量
-                    completion_tokens = FileProcessorHelper.tiktoken_len(chat_history[-1][1])
+                    completion_tokens = count_tokens(chat_history[-1][1])
                     # 总 token 数量
                     total_tokens = prompt_tokens + completion_tokens
                     logger.success(f"流式输出 | total_tokens: {total_tokens} "
@@ -180,29 +220,56 @@ def fn_chat(
             chat_history[-1][1] = bot_response
             logger.success(f"非流式输出 | bot_response: {chat_history[-1][1]}")
             yield chat_history
+        
+        # 写入答案缓存
+        if answer_cache_scope is not None:
+            get_answer_cache().put(answer_cache_scope, question_vector, chat_history[-1][1])
             
-def fn_upload_files(unuploaded_file_paths):
+def fn_upload_files(unuploaded_file_paths, replace_doc_key):
     """
     上传文件
+    文件提交到后台任务并发入库，定时刷新每个文件的进度；
+    入库完成的文件立即加入已上传列表，可以马上用于文档问答。
+    选择了要替换的文档时，上传的文件作为该文档的新版本，只对变化的块重新向量化
     """
-    # 初始化上传成功的文件列表
-    uploaded_file_paths = []
+    if replace_doc_key and len(unuploaded_file_paths) > 1:
+        raise gr.Error("替换已有文档时只能上传一个文件")
+    manager = get_ingest_job_manager()
+    job_ids = [
+        manager.submit(str(file_path), replace_doc_key or None).job_id for file_path in unuploaded_file_paths
+    ]
     
-    # 循环处理待上传的文件
-    for file_path in unuploaded_file_paths:
-        # 调用上传文件函数
-        result = upload_files(str(file_path))
-        # 处理函数结果
-        if result.get('code') == 200:
-            # 上传成功
-            gr.Info("文件上传成功！")
-            uploaded_file_paths.append(
-                result.get('data').get('uploaded_file_path'))
-        else:
-            # 上传失败
-            raise gr.Error("文件上传失败！")    
+    notified = set()
+    while True:
+        jobs = manager.get_jobs(job_ids)
+        for job in jobs:
+            if job.finished and job.job_id not in notified:
+                notified.add(job.job_id)
+                if job.status == JOB_DONE:
+                    gr.Info(f"文件上传成功！{job.file_name}")
+                else:
+                    gr.Warning(f"文件上传失败！{job.file_name}")
         
-    return pd.DataFrame({'已上传的文件': uploaded_file_paths})
+        uploaded_file_paths = [job.uploaded_file_path for job in jobs if job.status == JOB_DONE]
+        yield (
+            pd.DataFrame({'已上传的文件': uploaded_file_paths}),
+            pd.DataFrame([job.to_dict() for job in jobs])
+        )
+        if all(job.finished for job in jobs):
+            break
+        time.sleep(INGEST_POLL_INTERVAL)
+
+
+def fn_refresh_documents():
+    """
+    刷新可替换的文档列表，并清空已选择的文档，避免下一次上传误替换
+    """
+    choices = [
+        (f"{document['file_name'] or document['doc_key'][:8]}"
+         f"（{time.strftime('%Y-%m-%d %H:%M', time.localtime(document['updated_at']))}）", document['doc_key'])
+        for document in get_document_manifest().list_documents()
+    ]
+    return gr.Dropdown(choices=choices, value=None)
 
 
 
@@ -227,6 +294,13 @@ with gr.Blocks() as demo:
                     value="文档问答",
                     interactive=True
                 )
+                replace_doc_dropdown = gr.Dropdown(
+                    label="替换已有文档",
+                    info="不选择时作为新文档上传",
+                    choices=[],
+                    value=None,
+                    interactive=True
+                )
                 file_path_files = gr.Files(
                     label="文件上传",
                     file_count="multiple",
@@ -236,9 +310,14 @@ with gr.Blocks() as demo:
                 file_path_dataframe = gr.Dataframe(
                     value=pd.DataFrame({'已上传的文件': []})
                 )
+                ingest_status_dataframe = gr.Dataframe(
+                    label="入库进度",
+                    value=pd.DataFrame(),
+                    interactive=False
+                )
                 top_n_number = gr.Number(
                     label="top n",
-                    value=20,
+                    value=8,
                     interactive=True
                 )
             # 创建一个选项卡，用于调整参数
@@ -328,11 +407,21 @@ with gr.Blocks() as demo:
     # 上传文件时触发。
     file_path_files.upload(
         fn=fn_upload_files,
-        inputs=[file_path_files],
-        outputs=[file_path_dataframe],  # 展示已上传的文件
-        show_progress=True,  # 如果为 True，则在挂起时显示进度动画
+        inputs=[file_path_files, replace_doc_dropdown],
+        outputs=[file_path_dataframe, ingest_status_dataframe],  # 展示已上传的文件及入库进度
+        show_progress=False,  # 进度由入库进度表展示
+    ).then(
+        fn=fn_refresh_documents,
+        outputs=[replace_doc_dropdown]
     )
     
+    # 页面加载时读取可替换的文档列表
+    demo.load(fn=fn_refresh_documents, outputs=[replace_doc_dropdown])
+    
 if __name__ == "__main__":
-    demo.queue().launch()
+    # 启动前检查向量库，同时预热共享客户端的连接，向量库不可用时直接退出
+    if not get_vector_store().health_check():
+        logger.error("向量库不可用，退出启动")
+        sys.exit(1)
+    demo.queue(default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT).launch()
 
@@ -18,6 +18,18 @@ API_KEY = os.getenv("ZHIPUAI_API_KEY")
 BASE_URL = os.getenv("ZHIPUAI_API_BASE")
 
 EMBEDDINGS_MODEL = "embedding-3"
+EMBEDDING_DIMENSION = 2048  # embedding-3 默认输出维度
+
+# 向量化批处理配置
+EMBEDDING_BATCH_SIZE = 64  # 单次 embeddings.create 请求的最大文本条数
+EMBEDDING_BATCH_MAX_TOKENS = 8000  # 单次 embeddings.create 请求的最大 token 数
+EMBEDDING_MAX_WORKERS = 4  # 并发请求 embeddings.create 的线程数
+EMBEDDING_MAX_RETRIES = 3  # 每个批次失败后的重试次数
+
+# 向量缓存配置
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = 200000  # 超过后按最近最少使用淘汰
 
 
 MODELS = [
@@ -33,8 +45,135 @@ MODEL_TO_MAX_TOKENS = {
     'glm-4v-plus': 8192
 }
 
+# 大模型客户端连接池配置，同一 (base_url, api_key) 在进程内共享一个客户端
+LLM_TIMEOUT = 600  # 读写超时时间（秒），与 OpenAI SDK 默认值一致，非流式长回复可能很久才返回首字节
+LLM_CONNECT_TIMEOUT = 10  # 建立连接的超时时间（秒）
+LLM_MAX_CONNECTIONS = 100  # 连接池最大连接数
+LLM_MAX_KEEPALIVE_CONNECTIONS = 20  # 保持长连接的最大连接数
+LLM_KEEPALIVE_EXPIRY = 60  # 空闲长连接的保持时间（秒）
+LLM_HTTP2 = True  # 安装了 h2 时使用 HTTP/2，多个请求复用同一个连接
+LLM_MAX_CONCURRENCY = 64  # 异步调用时每个服务同时进行的最大请求数，流式请求在输出期间一直占用
+GRADIO_CONCURRENCY_LIMIT = 256  # 每个界面事件同时处理的请求数，异步处理函数不占用工作线程
+
 QDRANT_HOST = "localhost"
 QDRANT_PORT = 6333
+QDRANT_GRPC_PORT = 6334
+QDRANT_PREFER_GRPC = False  # 为 True 时使用 gRPC 传输
+QDRANT_TIMEOUT = 10  # 请求超时时间（秒）
+QDRANT_MAX_CONNECTIONS = 32  # HTTP 连接池最大连接数
+QDRANT_MAX_KEEPALIVE_CONNECTIONS = 16  # 保持长连接的最大连接数
+QDRANT_KEEPALIVE_EXPIRY = 60  # 空闲长连接的保持时间（秒）
+
+# 集合配置档位，在内存占用、召回率和检索延迟之间取舍
+# on_disk: 原始向量存磁盘; hnsw_m / hnsw_ef_construct: 建图参数; quantization: None / "scalar" / "product"
+# search_hnsw_ef: 检索时的候选数; rescore / oversampling: 量化检索后用原始向量重排及过采样倍数
+COLLECTION_PROFILES = {
+    # 全精度向量常驻内存
+    "default": {
+        "on_disk": False,
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 100,
+        "quantization": None,
+        "search_hnsw_ef": 128,
+    },
+    # int8 标量量化，量化向量常驻内存，原始向量存磁盘，内存约为原来的 1/4
+    "scalar": {
+        "on_disk": True,
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 100,
+        "quantization": "scalar",
+        "quantile": 0.99,
+        "always_ram": True,
+        "search_hnsw_ef": 128,
+        "rescore": True,
+        "oversampling": 2.0,
+    },
+    # 乘积量化，压缩比 16，适合超大语料，召回率损失较大，依赖重排
+    "product": {
+        "on_disk": True,
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 100,
+        "quantization": "product",
+        "compression": "x16",
+        "always_ram": True,
+        "search_hnsw_ef": 128,
+        "rescore": True,
+        "oversampling": 3.0,
+    },
+}
+COLLECTION_PROFILE = "default"
+
+QDRANT_UPSERT_BATCH_SIZE = 256  # 单次 upsert 请求的最大节点数
+QDRANT_UPSERT_PARALLEL = 2  # 并发发送 upsert 请求的线程数
+QDRANT_SCROLL_BATCH_SIZE = 256  # 按顺序导出集合内容时每页的节点数
+QDRANT_SEARCH_TIMEOUT = 5  # 单个集合检索的超时时间（秒），超时的集合不参与排序
+QDRANT_SEARCH_MAX_WORKERS = 16  # 多集合并发检索的线程数
+
+# 集合组织方式
+# per_file: 每个文件一个集合，集合名为文件摘要
+# shared: 所有文件写入同一个集合，payload 中的 doc_id 字段（建有索引）区分文档，检索时一次过滤查询
+COLLECTION_MODE = "per_file"
+SHARED_COLLECTION_NAME = "kk_gpt_documents"
+
+# 文件摘要配置
+# md5: 兼容已有的以 md5 命名的集合; blake2b/xxhash: 更快的摘要，集合名带算法前缀
+FILE_HASH_ALGORITHM = "md5"
+FILE_HASH_BLOCK_SIZE = 1024 * 1024  # 分块读取大小 1MB
+FILE_HASH_MMAP_THRESHOLD = 64 * 1024 * 1024  # 超过 64MB 的文件使用 mmap 计算摘要
+
+# PDF 解析配置
+PDF_EXTRACT_WORKERS = os.cpu_count() or 1  # 多进程解析 PDF 的进程数
+PDF_PARALLEL_MIN_PAGES = 20  # 页数达到该值才启用多进程解析
+
+# 文档清单（记录每个文档的块哈希与节点 id，用于增量更新）
+STORAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "storage")
+DOCUMENT_MANIFEST_PATH = os.path.join(STORAGE_DIR, "document_manifest.db")
+
+# 向量库后端 qdrant: Qdrant 服务; local: 进程内本地索引（NumPy 矩阵 + 内存映射文件），无需外部服务
+VECTOR_STORE_BACKEND = "qdrant"
+LOCAL_VECTOR_STORE_DIR = os.path.join(STORAGE_DIR, "vectors")
+LOCAL_IVF_ENABLED = False  # 是否启用倒排聚类（IVF）近似检索
+LOCAL_IVF_MIN_POINTS = 50000  # 集合节点数达到该值才建立 IVF
+LOCAL_IVF_NPROBE = 8  # IVF 检索时探查的聚类数
+
+# 混合检索配置：BM25 稀疏检索与向量检索的结果按倒数排名融合（RRF）
+# 开启之前入库的文档没有 BM25 索引，首次被检索时自动从向量库补建；
+# 也可以调用 document_index.build_lexical_index() 一次性补建全部文档，避免首次提问时等待
+HYBRID_SEARCH_ENABLED = True
+LEXICAL_INDEX_PATH = os.path.join(STORAGE_DIR, "lexical_index.db")
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # 排名平滑常数，越大越看重排名靠后的结果
+HYBRID_CANDIDATES_FACTOR = 3  # 每路检索取 top_n 的倍数作为候选参与融合
+
+# token 计数配置
+TOKEN_ENCODING = "cl100k_base"
+TOKEN_COUNT_MEMO_SIZE = 65536  # 缓存的文本条数
+TOKEN_COUNT_MEMO_MAX_CHARS = 8192  # 超过该长度的文本不缓存
+
+# 流式入库配置
+INGEST_QUEUE_SIZE = 256  # 解析/切分阶段与向量化阶段之间的队列容量（文档块数）
+INGEST_WINDOW_SIZE = EMBEDDING_BATCH_SIZE * EMBEDDING_MAX_WORKERS  # 每轮向量化并写入的文档块数
+
+# 后台入库任务配置
+INGEST_MAX_JOBS = 2  # 同时入库的文件数
+INGEST_JOB_HISTORY = 200  # 保留的已完成任务数
+INGEST_POLL_INTERVAL = 0.5  # 界面刷新入库进度的间隔（秒）
+
+# 上下文打包配置
+# prompt 总长度 = 模型上下文长度(MODEL_TO_MAX_TOKENS) - 生成长度(max_tokens) - PROMPT_RESERVED_TOKENS
+PROMPT_RESERVED_TOKENS = 256  # 预留给消息格式开销以及本地分词与模型分词之间的误差
+CHAT_HISTORY_MAX_RATIO = 0.25  # 对话历史最多占用可用预算的比例，其余留给文档内容
+CONTEXT_SEPARATOR = "\n---\n"
+CONTEXT_DEDUP_THRESHOLD = 0.9  # 两个块的字符 3-gram 相似度达到该值时视为重复
+
+# 语义答案缓存配置
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_THRESHOLD = 0.95  # 问题向量的余弦相似度不低于该值时命中
+ANSWER_CACHE_TTL = 3600  # 答案的有效期（秒）
+ANSWER_CACHE_MAX_ENTRIES = 1024  # 超过后按最近最少使用淘汰
+ANSWER_CACHE_FIRST_TURN_ONLY = True  # 对话历史会影响回答，默认只缓存没有对话历史的提问
+ANSWER_CACHE_STREAM_CHUNK_SIZE = 8  # 流式返回缓存答案时每段的字符数
 
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 100
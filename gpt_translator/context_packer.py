@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-24 20:30
+# @Desc   : 上下文打包：去重、合并相邻块，并在 token 预算内填充文档内容与对话历史
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import re
+from typing import List, Tuple
+from loguru import logger
+
+from token_counter import count_tokens
+from vector_store import DOC_ID_FIELD
+from config import CONTEXT_SEPARATOR, CONTEXT_DEDUP_THRESHOLD, CHUNK_OVERLAP
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def _normalize(text):
+    """
+    去掉空白后用于比较，切分时块首尾空白可能不同
+    """
+    return _WHITESPACE_PATTERN.sub("", text)
+
+
+def _shingles(text, size=3):
+    """
+    字符 n-gram 集合，用于估计两个块的相似度
+    """
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _overlap_length(a, b):
+    """
+    a 的后缀与 b 的前缀的最长重叠长度（KMP 前缀函数，线性时间）
+    """
+    if not a or not b:
+        return 0
+    s = b + "\0" + a[-len(b):]
+    prefix = [0] * len(s)
+    for i in range(1, len(s)):
+        k = prefix[i - 1]
+        while k and s[i] != s[k]:
+            k = prefix[k - 1]
+        if s[i] == s[k]:
+            k += 1
+        prefix[i] = k
+    return prefix[-1]
+
+
+def _group_key(payload):
+    """
+    同一文档同一页的块才会合并。文档以检索时带上的索引键区分（shared 模式为 doc_id，per_file 模式为集合名），
+    同名文件的不同版本索引键不同，不会被合并；只有没有索引键的节点才按文件名区分
+    """
+    metadata = payload.get("metadata") or {}
+    source = payload.get(DOC_ID_FIELD)
+    if source is None:
+        source = ("file_name", metadata.get("file_name"))
+    return source, metadata.get("page_number")
+
+
+def pack_context(points: List, max_tokens: int = None, separator: str = CONTEXT_SEPARATOR,
+                 dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD) -> str:
+    """
+    将检索结果打包为上下文，总 token 数不超过 max_tokens，max_tokens 为 None 时不限制长度。
+    1. 按排名依次选取，跳过与已选块重复或高度相似的块（块间 CHUNK_OVERLAP 会产生近似重复），放不下的块也跳过；
+    2. 同一文档同一页中块序号相邻的块合并为一段，去掉重叠部分；
+    3. 各段按其中排名最高的块排序，用分隔符连接。
+    """
+    if (max_tokens is not None and max_tokens <= 0) or not points:
+        return ""
+    separator_tokens = count_tokens(separator)
+
+    selected = []  # (排名, payload, 归一化文本, shingles)
+    used_tokens = 0
+    for rank, point in enumerate(points):
+        payload = point.payload or {}
+        text = payload.get("page_content", "")
+        normalized = _normalize(text)
+        if not normalized:
+            continue
+        shingles = _shingles(normalized)
+        if any(normalized in other or other in normalized
+               or len(shingles & other_shingles) >= dedup_threshold * len(shingles | other_shingles)
+               for _, _, other, other_shingles in selected):
+            continue
+        tokens = count_tokens(text) + (separator_tokens if selected else 0)
+        if max_tokens is not None and used_tokens + tokens > max_tokens:
+            continue
+        selected.append((rank, payload, normalized, shingles))
+        used_tokens += tokens
+
+    # 合并同一页中相邻的块
+    groups = {}
+    for rank, payload, _, _ in selected:
+        groups.setdefault(_group_key(payload), []).append((rank, payload))
+    sections: List[Tuple[int, str]] = []
+    for members in groups.values():
+        members.sort(key=lambda member: (member[1].get("metadata") or {}).get("chunk_index", -1))
+        best_rank, text, last_index = None, None, None
+        for rank, payload in members:
+            chunk_index = (payload.get("metadata") or {}).get("chunk_index")
+            content = payload.get("page_content", "")
+            if text is not None and chunk_index is not None and last_index is not None and chunk_index == last_index + 1:
+                # 切分时没有重叠则直接拼接，避免偶然相同的首尾字符被误删
+                text += content[_overlap_length(text, content):] if CHUNK_OVERLAP > 0 else content
+                best_rank = min(best_rank, rank)
+            else:
+                if text is not None:
+                    sections.append((best_rank, text))
+                best_rank, text = rank, content
+            last_index = chunk_index
+        sections.append((best_rank, text))
+    sections.sort(key=lambda section: section[0])
+
+    context = separator.join(text for _, text in sections)
+    logger.debug(f"上下文打包 | 检索结果: {len(points)}, 选中: {len(selected)}, 合并后: {len(sections)}, "
+                 f"tokens: {count_tokens(context)}/{max_tokens}")
+    return context
+
+
+def trim_chat_history(chat_history: List, max_tokens: int) -> str:
+    """
+    将对话历史格式化为文本，从最近的一轮开始向前保留，总 token 数不超过 max_tokens
+    """
+    lines = []
+    used_tokens = 0
+    for chat in reversed(chat_history):
+        turn = []
+        if chat[0]:
+            turn.append(f'user:{chat[0]}')
+        if chat[1]:
+            turn.append(f'assistant:{chat[1]}')
+        if not turn:
+            continue
+        tokens = count_tokens("\n".join(turn)) + 1
+        if used_tokens + tokens > max_tokens:
+            logger.debug(f"对话历史超出预算，保留最近 {len(lines)} 条消息 | max_tokens: {max_tokens}")
+            break
+        lines[:0] = turn
+        used_tokens += tokens
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # 测试
+    from collections import namedtuple
+    Point = namedtuple("Point", ["id", "score", "payload"])
+    points = [
+        Point(1, 0.9, {"page_content": "第一段内容，结尾重叠部分", "doc_id": "a", "metadata": {"page_number": 1, "chunk_index": 0}}),
+        Point(2, 0.8, {"page_content": "结尾重叠部分，第二段内容", "doc_id": "a", "metadata": {"page_number": 1, "chunk_index": 1}}),
+        Point(3, 0.7, {"page_content": "第一段内容，结尾重叠部分", "doc_id": "a", "metadata": {"page_number": 3, "chunk_index": 9}}),
+        Point(4, 0.6, {"page_content": "另一个文件的同页内容", "doc_id": "b", "metadata": {"page_number": 1, "chunk_index": 2}}),
+    ]
+    print(pack_context(points, max_tokens=100))
+    print(trim_chat_history([("你好", "你好！"), ("介绍一下文档", "这是一份文档。")], max_tokens=20))
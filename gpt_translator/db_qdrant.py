@@ -13,17 +13,79 @@ import sys
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(root_dir)
 
+import time
+import threading
+import httpx
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, Batch
+from qdrant_client.http.models import Distance, VectorParams, Batch, PointIdsList, OrderBy, Direction, PayloadSchemaType
+from qdrant_client.http.models import Filter, FieldCondition, MatchAny, MatchValue, FilterSelector
+from qdrant_client.http.models import OverwritePayloadOperation, SetPayload
+from qdrant_client.http.models import (
+    HnswConfigDiff,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    ProductQuantization,
+    ProductQuantizationConfig,
+    CompressionRatio,
+    SearchParams,
+    QuantizationSearchParams,
+)
 from qdrant_client.http.exceptions import UnexpectedResponse  # 捕获错误信息
-from config import QDRANT_HOST, QDRANT_PORT
+from vector_store import BaseVectorStore, payload_point_id, DOC_ID_FIELD
+from config import QDRANT_HOST, QDRANT_PORT, EMBEDDING_DIMENSION, QDRANT_UPSERT_BATCH_SIZE, QDRANT_UPSERT_PARALLEL, QDRANT_SCROLL_BATCH_SIZE
+from config import (
+    QDRANT_GRPC_PORT,
+    QDRANT_PREFER_GRPC,
+    QDRANT_TIMEOUT,
+    QDRANT_MAX_CONNECTIONS,
+    QDRANT_MAX_KEEPALIVE_CONNECTIONS,
+    QDRANT_KEEPALIVE_EXPIRY,
+    COLLECTION_PROFILES,
+    COLLECTION_PROFILE,
+)
 
+# 块序号字段，按该字段的顺序即可还原文档
+CHUNK_INDEX_FIELD = "metadata.chunk_index"
 
-class QdrantDB:
-    def __init__(self) -> None:
-        self.client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)  # 创建客户端实例
-        self.size = 2048  # openai embedding 的维度是2048
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_qdrant_client(host=QDRANT_HOST, port=QDRANT_PORT, prefer_grpc=QDRANT_PREFER_GRPC):
+    """
+    获取进程内共享的客户端，同一地址只创建一次，各线程复用其连接池和长连接
+    """
+    key = (host, port, prefer_grpc)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = QdrantClient(
+                    host=host,
+                    port=port,
+                    grpc_port=QDRANT_GRPC_PORT,
+                    prefer_grpc=prefer_grpc,
+                    timeout=QDRANT_TIMEOUT,
+                    limits=httpx.Limits(
+                        max_connections=QDRANT_MAX_CONNECTIONS,
+                        max_keepalive_connections=QDRANT_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=QDRANT_KEEPALIVE_EXPIRY
+                    )
+                )
+                _clients[key] = client
+                logger.info(f"创建 Qdrant 客户端 | host: {host}, port: {port}, prefer_grpc: {prefer_grpc}")
+    return client
+
+
+class QdrantDB(BaseVectorStore):
+    def __init__(self, profile=COLLECTION_PROFILE) -> None:
+        self.client = get_qdrant_client()  # 共享的客户端实例
+        self.size = EMBEDDING_DIMENSION  # embedding 的维度是2048
+        self.profile = COLLECTION_PROFILES[profile]  # 集合配置档位
         
     def get_points_count(self, collection_name):
         """
@@ -58,6 +120,20 @@ class QdrantDB:
             return points_count
         
         
+    def health_check(self):
+        """
+        检查 Qdrant 服务是否可用，可用时返回 True
+        """
+        start = time.perf_counter()
+        try:
+            self.client.get_collections()
+        except Exception as e:
+            logger.error(f"Qdrant 服务不可用 | 错误信息: {e}")
+            return False
+        logger.debug(f"Qdrant 服务可用 | 耗时: {(time.perf_counter() - start) * 1000:.1f}ms")
+        return True
+        
+        
     def list_all_collections_names(self):
         """
         CollectionsResponse类型举例：
@@ -82,12 +158,101 @@ class QdrantDB:
         Returns:
             bool: 如果成功创建集合，则返回True；否则返回False。
         """
-        return self.client.recreate_collection(
+        result = self.client.recreate_collection(
             collection_name=collection_name,
-            vectors_config=VectorParams(size=self.size, distance=Distance.COSINE)
+            vectors_config=VectorParams(
+                size=self.size,
+                distance=Distance.COSINE,
+                on_disk=self.profile.get("on_disk", False)
+            ),
+            hnsw_config=HnswConfigDiff(
+                m=self.profile.get("hnsw_m"),
+                ef_construct=self.profile.get("hnsw_ef_construct")
+            ),
+            quantization_config=self.build_quantization_config()
+        )
+        # 为块序号建立索引，按顺序导出文档时使用
+        self.create_chunk_index(collection_name)
+        # 为文档 id 建立索引，单集合多文档模式下按文档过滤时使用
+        self.client.create_payload_index(
+            collection_name=collection_name,
+            field_name=DOC_ID_FIELD,
+            field_schema=PayloadSchemaType.KEYWORD,
+            wait=True
+        )
+        return result
+    
+    
+    def build_quantization_config(self):
+        """
+        根据配置档位构建量化配置，不量化时返回 None
+        """
+        quantization = self.profile.get("quantization")
+        if quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8,
+                    quantile=self.profile.get("quantile"),
+                    always_ram=self.profile.get("always_ram")
+                )
+            )
+        if quantization == "product":
+            return ProductQuantization(
+                product=ProductQuantizationConfig(
+                    compression=CompressionRatio(self.profile.get("compression", "x16")),
+                    always_ram=self.profile.get("always_ram")
+                )
+            )
+        return None
+    
+    
+    def build_search_params(self, exact=False):
+        """
+        根据配置档位构建检索参数
+        exact 为 True 时对原始向量做精确检索，忽略量化向量和 hnsw_ef，作为测量召回率的基准
+        """
+        if exact:
+            quantization_params = None
+            if self.profile.get("quantization"):
+                quantization_params = QuantizationSearchParams(ignore=True)
+            return SearchParams(exact=True, quantization=quantization_params)
+        
+        quantization_params = None
+        if self.profile.get("quantization"):
+            quantization_params = QuantizationSearchParams(
+                ignore=False,
+                rescore=self.profile.get("rescore", True),
+                oversampling=self.profile.get("oversampling")
+            )
+        return SearchParams(
+            hnsw_ef=self.profile.get("search_hnsw_ef"),
+            quantization=quantization_params
         )
     
     
+    def create_chunk_index(self, collection_name):
+        """
+        为块序号字段创建整数索引
+        """
+        self.client.create_payload_index(
+            collection_name=collection_name,
+            field_name=CHUNK_INDEX_FIELD,
+            field_schema=PayloadSchemaType.INTEGER,
+            wait=True
+        )
+    
+    
+    def collection_exists(self, collection_name):
+        """
+        判断集合是否存在
+        """
+        try:
+            self.get_collection(collection_name)
+        except (UnexpectedResponse, ValueError):
+            return False
+        return True
+    
+    
     def get_collection(self, collection_name):
         """
         获取集合信息。
@@ -102,59 +267,273 @@ class QdrantDB:
         return collection_info
     
     
-    def add_points(self, collection_name, vectors, payloads):
-        # 将数据点添加到Qdrant
-        self.client.upsert(
+    def delete_collection(self, collection_name):
+        """
+        删除集合
+        """
+        return self.client.delete_collection(collection_name=collection_name)
+    
+    
+    def add_points(self,
+                   collection_name,
+                   vectors,
+                   payloads,
+                   ids=None,
+                   batch_size=QDRANT_UPSERT_BATCH_SIZE,
+                   parallel=QDRANT_UPSERT_PARALLEL,
+                   wait=True):
+        """
+        分批写入节点。
+        
+        Args:
+            ids: 节点 id，未指定时由集合名和 payload 内容生成，重复写入同一内容不会产生新节点，也不会覆盖其他节点
+            batch_size: 单次 upsert 请求的最大节点数
+            parallel: 并发发送请求的线程数
+            wait: 为 True 时前面的批次不等待落盘，最后一个批次等待落盘，
+                  Qdrant 按顺序应用同一集合的更新，最后一个批次完成即表示全部批次已生效
+
+        Returns:
+            bool: 写入成功返回 True
+        """
+        if ids is None:
+            ids = [payload_point_id(collection_name, payload) for payload in payloads]
+        if not ids:
+            return True
+        
+        batches = [
+            Batch(
+                ids=ids[start:start + batch_size],
+                vectors=vectors[start:start + batch_size],
+                payloads=payloads[start:start + batch_size]
+            )
+            for start in range(0, len(ids), batch_size)
+        ]
+        barrier = batches.pop() if wait else None
+        
+        def upsert(batch, wait_batch=False):
+            # 将数据点添加到Qdrant
+            self.client.upsert(collection_name=collection_name, wait=wait_batch, points=batch)
+        
+        if parallel > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=min(parallel, len(batches))) as executor:
+                # list() 等待所有请求返回，并抛出其中的异常
+                list(executor.map(upsert, batches))
+        else:
+            for batch in batches:
+                upsert(batch)
+        if barrier is not None:
+            upsert(barrier, wait_batch=True)
+        
+        logger.debug(f"写入节点 | collection_name: {collection_name}, 节点数: {len(ids)}, "
+                     f"批次数: {len(batches) + (barrier is not None)}")
+        return True
+    
+    
+    def retrieve_vectors(self, collection_name, ids):
+        """
+        获取指定节点的向量，返回 {节点id: 向量}
+        """
+        records = self.client.retrieve(
+            collection_name=collection_name,
+            ids=ids,
+            with_payload=False,
+            with_vectors=True
+        )
+        return {str(record.id): record.vector for record in records}
+    
+    
+    def delete_points(self, collection_name, ids):
+        """
+        删除指定节点
+        """
+        self.client.delete(
             collection_name=collection_name,
-            wait=True,
-            points=Batch(
-                ids=list(range(1, len(vectors) + 1)),
-                vectors=vectors,
-                payloads=payloads
+            points_selector=PointIdsList(points=ids),
+            wait=True
+        )
+        return True
+    
+    
+    def set_payloads(self, collection_name, ids, payloads, batch_size=QDRANT_UPSERT_BATCH_SIZE):
+        """
+        覆盖指定节点的 payload，不改动向量，每个请求最多包含 batch_size 个节点
+        """
+        operations = [
+            OverwritePayloadOperation(overwrite_payload=SetPayload(payload=payload, points=[point_id]))
+            for point_id, payload in zip(ids, payloads)
+        ]
+        for start in range(0, len(operations), batch_size):
+            self.client.batch_update_points(
+                collection_name=collection_name,
+                update_operations=operations[start:start + batch_size],
+                wait=True
             )
+        return True
+    
+    
+    @staticmethod
+    def build_doc_filter(doc_ids):
+        """
+        构建按文档 id 过滤的条件，doc_ids 为空时不过滤
+        """
+        if not doc_ids:
+            return None
+        if isinstance(doc_ids, str):
+            return Filter(must=[FieldCondition(key=DOC_ID_FIELD, match=MatchValue(value=doc_ids))])
+        return Filter(must=[FieldCondition(key=DOC_ID_FIELD, match=MatchAny(any=list(doc_ids)))])
+    
+    
+    def count_points(self, collection_name, doc_id=None):
+        """
+        统计节点数，doc_id 不为空时只统计该文档的节点
+        """
+        return self.client.count(
+            collection_name=collection_name,
+            count_filter=self.build_doc_filter(doc_id),
+            exact=True
+        ).count
+    
+    
+    def delete_document(self, collection_name, doc_id):
+        """
+        删除集合中某个文档的全部节点
+        """
+        self.client.delete(
+            collection_name=collection_name,
+            points_selector=FilterSelector(filter=self.build_doc_filter(doc_id)),
+            wait=True
         )
         return True
     
     
-    def search(self, collection_name, query_vector, limit=3):
+    def iter_points(self, collection_name, doc_id=None, batch_size=QDRANT_SCROLL_BATCH_SIZE):
+        """
+        分页逐个产出集合中的 (节点id, 向量, payload)，doc_id 不为空时只产出该文档的节点
+        """
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=self.build_doc_filter(doc_id),
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            for record in records:
+                yield record.id, record.vector, record.payload
+            if offset is None:
+                break
+    
+    
+    def search(self, collection_name, query_vector, limit=3, timeout=None, search_params=None, doc_ids=None):
         """
-        搜索与查询向量最相似的点
+        搜索与查询向量最相似的点，结果按分数降序排列
+        search_params 未指定时使用配置档位的检索参数
+        doc_ids 不为空时只检索这些文档的节点
         """
         # 搜索与查询向量最相似的点
         search_results = self.client.search(
             collection_name=collection_name,
             query_vector=query_vector,
+            query_filter=self.build_doc_filter(doc_ids),
             limit=limit,
-            with_payload=True
+            with_payload=True,
+            search_params=search_params or self.build_search_params(),
+            timeout=timeout
         )
         return search_results
     
     
-    def get_collection_content(self, collection_name, limit=1000):
+    def measure_search_quality(self, collection_name, query_vectors, limit=10):
+        """
+        以精确检索为基准，测量当前档位近似检索的召回率和平均延迟，用于选择配置档位
+        
+        Returns:
+            dict: recall 召回率, latency_ms 近似检索平均延迟, exact_latency_ms 精确检索平均延迟
         """
-        获取ScoredPoint对象列表
+        recalls = []
+        latencies = []
+        exact_latencies = []
+        for query_vector in query_vectors:
+            start = time.perf_counter()
+            exact_points = self.search(collection_name, query_vector, limit, search_params=self.build_search_params(exact=True))
+            exact_latencies.append(time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            points = self.search(collection_name, query_vector, limit)
+            latencies.append(time.perf_counter() - start)
+            
+            exact_ids = {point.id for point in exact_points}
+            if exact_ids:
+                recalls.append(len(exact_ids & {point.id for point in points}) / len(exact_ids))
+        
+        quality = {
+            "recall": sum(recalls) / len(recalls) if recalls else 0.0,
+            "latency_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "exact_latency_ms": sum(exact_latencies) / len(exact_latencies) * 1000 if exact_latencies else 0.0,
+        }
+        logger.info(f"检索质量 | collection_name: {collection_name}, {quality}")
+        return quality
+    
+    
+    def iter_collection_content(self, collection_name, doc_id=None, batch_size=QDRANT_SCROLL_BATCH_SIZE):
         """
-        score_points = self.client.search(
+        按块顺序逐个产出集合中的 page_content，分页 scroll 且不取向量，内存占用与集合大小无关。
+        有块序号的集合按块序号排序分页；旧集合没有块序号，其id即为块序号，按id分页。
+        doc_id 不为空时只导出该文档（单集合多文档模式）。
+        """
+        scroll_filter = self.build_doc_filter(doc_id)
+        if self._has_chunk_index(collection_name):
+            start_from = None
+            while True:
+                records, _ = self.client.scroll(
+                    collection_name=collection_name,
+                    limit=batch_size,
+                    with_payload=["page_content", CHUNK_INDEX_FIELD],
+                    with_vectors=False,
+                    scroll_filter=scroll_filter,
+                    order_by=OrderBy(key=CHUNK_INDEX_FIELD, direction=Direction.ASC, start_from=start_from)
+                )
+                for record in records:
+                    yield record.payload.get('page_content', '')
+                if len(records) < batch_size:
+                    break
+                start_from = records[-1].payload['metadata']['chunk_index'] + 1
+        else:
+            offset = None
+            while True:
+                records, offset = self.client.scroll(
+                    collection_name=collection_name,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=["page_content"],
+                    with_vectors=False,
+                    scroll_filter=scroll_filter
+                )
+                for record in records:
+                    yield record.payload.get('page_content', '')
+                if offset is None:
+                    break
+    
+    
+    def _has_chunk_index(self, collection_name):
+        """
+        判断集合能否按块序号排序，节点带块序号但还没有索引时补建索引
+        """
+        collection_info = self.get_collection(collection_name)
+        if CHUNK_INDEX_FIELD in (collection_info.payload_schema or {}):
+            return True
+        records, _ = self.client.scroll(
             collection_name=collection_name,
-            query_vector=[0.0] * self.size,
-            limit=limit,
-            with_payload=True
+            limit=1,
+            with_payload=[CHUNK_INDEX_FIELD],
+            with_vectors=False
         )
-        
-        # 将该对象列表按id升序排序
-        score_points.sort(key=lambda x: x.id)
-        logger.info(f"当前集合：{collection_name} 的节点总数：{len(score_points)}")
-        
-        # 提取每个ScoredPoint对象中的payload字典中的page_content
-        # payload表示向量的附加信息，每个payload都是一个字典，包含了page_content和metadata）
-        page_contents = [point.payload.get('page_content', '') for point in score_points]
-        content = "".join(page_contents)
-        logger.trace(f"当前集合：{collection_name} 的内容字符数：{len(content)}")
-        return content
-
-
-
-
+        if records and 'chunk_index' in records[0].payload.get('metadata', {}):
+            self.create_chunk_index(collection_name)
+            return True
+        return False
 
 
 if __name__ == "__main__":
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-22 20:40
+# @Desc   : 文档索引，屏蔽“每个文件一个集合”与“所有文件共用一个集合”两种组织方式的差异
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import math
+import threading
+from typing import List, Tuple
+from loguru import logger
+
+from vector_store import BaseVectorStore, get_vector_store, make_point_id, DOC_ID_FIELD
+from retriever import search_collections, reciprocal_rank_fusion
+from lexical_index import LexicalIndex, get_lexical_index
+from config import (
+    COLLECTION_MODE,
+    SHARED_COLLECTION_NAME,
+    QDRANT_SEARCH_TIMEOUT,
+    QDRANT_UPSERT_BATCH_SIZE,
+    HYBRID_SEARCH_ENABLED,
+    HYBRID_CANDIDATES_FACTOR,
+)
+
+# 补建 BM25 索引时加锁，避免并发的检索重复补建同一个文档
+_lexical_backfill_lock = threading.Lock()
+
+
+class DocumentIndex:
+    """
+    每个文档由一个索引键（文件摘要）标识，文档清单中记录的也是索引键。
+    per_file: 索引键即集合名，检索多个文档时并发检索多个集合再归并；
+    shared: 所有文档写入同一个集合，索引键作为 payload 中的 doc_id，检索多个文档只需一次过滤查询。
+    开启混合检索时，BM25 索引同样以索引键区分文档；开启之前入库的文档在首次被检索时从向量库补建 BM25 索引。
+    """
+    def __init__(self,
+                 vector_store: BaseVectorStore = None,
+                 mode: str = COLLECTION_MODE,
+                 shared_collection_name: str = SHARED_COLLECTION_NAME,
+                 lexical_index: LexicalIndex = None,
+                 ) -> None:
+        if mode not in ("per_file", "shared"):
+            raise ValueError(f"Unsupported collection mode: {mode}")
+        self.vector_store = vector_store if vector_store is not None else get_vector_store()
+        self.mode = mode
+        self.shared_collection_name = shared_collection_name
+        if lexical_index is None and HYBRID_SEARCH_ENABLED:
+            lexical_index = get_lexical_index()
+        self.lexical_index = lexical_index
+
+    @property
+    def shared(self):
+        return self.mode == "shared"
+
+    def target(self, key: str) -> Tuple[str, str]:
+        """
+        索引键 -> (集合名, doc_id)，per_file 模式下 doc_id 为 None
+        """
+        if self.shared:
+            return self.shared_collection_name, key
+        return key, None
+
+    def exists(self, key: str) -> bool:
+        """
+        文档是否已在库中
+        """
+        if self.shared:
+            return self.count(key) > 0
+        return self.vector_store.collection_exists(key)
+
+    def count(self, key: str) -> int:
+        """
+        文档的节点数，文档不存在时返回 0
+        """
+        collection_name, doc_id = self.target(key)
+        if not self.vector_store.collection_exists(collection_name):
+            return 0
+        return self.vector_store.count_points(collection_name, doc_id=doc_id)
+
+    def prepare(self, key: str) -> int:
+        """
+        准备写入文档：文档已存在时返回节点数，否则创建所需的集合并返回 0，出错时返回 -1
+        """
+        if not self.shared:
+            return self.vector_store.get_points_count(key)
+        try:
+            if not self.vector_store.collection_exists(self.shared_collection_name):
+                self.vector_store.create_collection(self.shared_collection_name)
+                logger.success(f"创建共享集合成功 | collection_name：{self.shared_collection_name}")
+            points_count = self.vector_store.count_points(self.shared_collection_name, doc_id=key)
+        except Exception as e:
+            logger.error(f"获取文档信息失败 | doc_id：{key} 错误信息: {e}")
+            return -1
+        logger.success(f"共享集合中的文档 | doc_id：{key} points_count：{points_count}")
+        return points_count
+
+    def delete(self, key: str) -> bool:
+        """
+        删除文档
+        """
+        if self.lexical_index is not None:
+            self.lexical_index.delete_document(key)
+        if self.shared:
+            return self.vector_store.delete_document(self.shared_collection_name, key)
+        return self.vector_store.delete_collection(key)
+
+    def search(self, keys: List[str], query_vector: List[float], top_n: int,
+               query: str = None, timeout: float = QDRANT_SEARCH_TIMEOUT) -> List:
+        """
+        在多个文档中检索分数最高的 top_n 个节点
+        传入问题原文且开启混合检索时，向量检索与 BM25 检索各取 top_n * HYBRID_CANDIDATES_FACTOR 个候选，按 RRF 融合
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys or top_n <= 0:
+            return []
+        if not query or self.lexical_index is None:
+            return self._dense_search(keys, query_vector, top_n, timeout)
+        
+        self._ensure_lexical(keys)
+        candidates = top_n * HYBRID_CANDIDATES_FACTOR
+        dense_points = self._dense_search(keys, query_vector, candidates, timeout)
+        sparse_points = self.lexical_index.search(keys, query, limit=candidates)
+        logger.debug(f"混合检索 | 向量候选: {len(dense_points)}, BM25候选: {len(sparse_points)}")
+        return reciprocal_rank_fusion([dense_points, sparse_points], top_n)
+
+    def _ensure_lexical(self, keys):
+        """
+        为没有 BM25 索引的文档补建索引，补建失败时只记录日志，该文档仍可通过向量检索命中
+        """
+        for key in self.lexical_index.missing_documents(keys):
+            with _lexical_backfill_lock:
+                if not self.lexical_index.missing_documents([key]):
+                    continue
+                collection_name, doc_id = self.target(key)
+                try:
+                    if not self.vector_store.collection_exists(collection_name):
+                        continue
+                    indexed = _backfill_lexical_document(
+                        self.vector_store, self.lexical_index, collection_name, key, doc_id)
+                except Exception as e:
+                    logger.error(f"补建BM25索引失败 | key: {key} 错误信息: {e}")
+                    continue
+            if indexed:
+                logger.success(f"补建BM25索引完成 | key: {key}, 块数: {indexed}")
+
+    def _dense_search(self, keys, query_vector, top_n, timeout):
+        """
+        向量检索，出错时返回空列表，与 per_file 模式下跳过出错集合的处理一致
+        """
+        if not self.shared:
+            return search_collections(self.vector_store, keys, query_vector, top_n, timeout)
+        try:
+            return self.vector_store.search(
+                self.shared_collection_name, query_vector, limit=top_n, timeout=math.ceil(timeout), doc_ids=keys)
+        except Exception as e:
+            logger.error(f"共享集合检索失败 | collection_name: {self.shared_collection_name} 错误信息: {e}")
+            return []
+
+    def iter_content(self, key: str):
+        """
+        按块顺序逐个产出文档的 page_content
+        """
+        collection_name, doc_id = self.target(key)
+        return self.vector_store.iter_collection_content(collection_name, doc_id=doc_id)
+
+
+def migrate_to_shared_collection(vector_store: BaseVectorStore = None,
+                                 shared_collection_name: str = SHARED_COLLECTION_NAME,
+                                 delete_source: bool = False,
+                                 batch_size: int = QDRANT_UPSERT_BATCH_SIZE) -> int:
+    """
+    将每个文件一个集合的数据迁移到共享集合，返回迁移的节点数。
+    原集合名（文件摘要）作为 doc_id，文档清单中记录的索引键无需修改。
+    向量直接复制，不重新向量化；uuid 节点 id 保持不变，旧集合的整数 id 按 (集合名, id) 重新生成。
+    同一个集合可以重复迁移，已迁移的节点会被覆盖。
+    """
+    vector_store = vector_store if vector_store is not None else get_vector_store()
+    if not vector_store.collection_exists(shared_collection_name):
+        vector_store.create_collection(shared_collection_name)
+
+    migrated = 0
+    for collection_name in vector_store.list_all_collections_names():
+        if collection_name == shared_collection_name:
+            continue
+        ids, vectors, payloads = [], [], []
+        count = 0
+        for point_id, vector, payload in vector_store.iter_points(collection_name):
+            if isinstance(point_id, int):
+                point_id = make_point_id(collection_name, point_id)
+            ids.append(point_id)
+            vectors.append(vector)
+            payloads.append(dict(payload, **{DOC_ID_FIELD: collection_name}))
+            if len(ids) >= batch_size:
+                vector_store.add_points(shared_collection_name, vectors, payloads, ids=ids)
+                count += len(ids)
+                ids, vectors, payloads = [], [], []
+        if ids:
+            vector_store.add_points(shared_collection_name, vectors, payloads, ids=ids)
+            count += len(ids)
+        migrated += count
+        logger.success(f"迁移集合完成 | collection_name: {collection_name}, points_count: {count}")
+
+        # 确认共享集合中的节点数一致后才删除原集合
+        if delete_source and vector_store.count_points(shared_collection_name, doc_id=collection_name) >= count:
+            vector_store.delete_collection(collection_name)
+    return migrated
+
+
+def _backfill_lexical_document(vector_store, lexical_index, collection_name, key, doc_id=None,
+                               batch_size=QDRANT_UPSERT_BATCH_SIZE):
+    """
+    将向量库中一个文档的节点写入 BM25 索引，返回写入的块数
+    """
+    indexed = 0
+    point_ids, payloads = [], []
+    for point_id, _, payload in vector_store.iter_points(collection_name, doc_id=doc_id):
+        point_ids.append(point_id)
+        payloads.append(payload)
+        if len(point_ids) >= batch_size:
+            lexical_index.add_chunks(key, point_ids, payloads)
+            indexed += len(point_ids)
+            point_ids, payloads = [], []
+    if point_ids:
+        lexical_index.add_chunks(key, point_ids, payloads)
+        indexed += len(point_ids)
+    return indexed
+
+
+def build_lexical_index(vector_store: BaseVectorStore = None,
+                        lexical_index: LexicalIndex = None,
+                        batch_size: int = QDRANT_UPSERT_BATCH_SIZE) -> int:
+    """
+    为开启混合检索之前入库的全部文档补建 BM25 索引，返回写入的块数。
+    检索时会自动为缺少索引的文档补建，升级后可运行本函数提前补建，避免首次提问时等待。
+    文档 id 取 payload 中的 doc_id，没有 doc_id 的节点使用集合名，与 DocumentIndex 的索引键一致。
+    """
+    vector_store = vector_store if vector_store is not None else get_vector_store()
+    lexical_index = lexical_index if lexical_index is not None else get_lexical_index()
+
+    indexed = 0
+    for collection_name in vector_store.list_all_collections_names():
+        batches = {}
+        for point_id, _, payload in vector_store.iter_points(collection_name):
+            doc_id = payload.get(DOC_ID_FIELD, collection_name)
+            batch = batches.setdefault(doc_id, ([], []))
+            batch[0].append(point_id)
+            batch[1].append(payload)
+            if len(batch[0]) >= batch_size:
+                lexical_index.add_chunks(doc_id, *batches.pop(doc_id))
+                indexed += batch_size
+        for doc_id, (point_ids, payloads) in batches.items():
+            lexical_index.add_chunks(doc_id, point_ids, payloads)
+            indexed += len(point_ids)
+        logger.success(f"补建BM25索引完成 | collection_name: {collection_name}")
+    return indexed
+
+
+if __name__ == "__main__":
+    # 测试
+    print(migrate_to_shared_collection())
+    print(build_lexical_index())
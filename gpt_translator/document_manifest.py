@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-14 21:10
+# @Desc   : 文档清单，记录文档所在集合、当前版本摘要、每个块的节点 id 以及正在写入的集合
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from config import DOCUMENT_MANIFEST_PATH
+
+
+class DocumentManifest:
+    def __init__(self, db_path: str = DOCUMENT_MANIFEST_PATH) -> None:
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_key TEXT PRIMARY KEY, "
+            "collection_name TEXT NOT NULL, "
+            "file_digest TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_file_digest ON documents (file_digest)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "doc_key TEXT NOT NULL, "
+            "point_id TEXT NOT NULL, "
+            "payload_hash TEXT NOT NULL, "
+            "chunk_index INTEGER, "
+            "PRIMARY KEY (doc_key, point_id))"
+        )
+        # 正在写入的集合，写入完成并保存文档记录后删除；进程中途退出时记录会保留下来
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            "collection_name TEXT PRIMARY KEY, "
+            "doc_key TEXT NOT NULL, "
+            "started_at REAL NOT NULL)"
+        )
+        # 旧版本的清单没有 chunk_index 列和 file_name 列
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(chunks)")]
+        if "chunk_index" not in columns:
+            self.conn.execute("ALTER TABLE chunks ADD COLUMN chunk_index INTEGER")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(documents)")]
+        if "file_name" not in columns:
+            self.conn.execute("ALTER TABLE documents ADD COLUMN file_name TEXT")
+        self.conn.commit()
+
+    def get_document(self, doc_key: str) -> Optional[Dict]:
+        """
+        获取文档记录
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT collection_name, file_digest FROM documents WHERE doc_key = ?", (doc_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"doc_key": doc_key, "collection_name": row[0], "file_digest": row[1]}
+
+    def list_documents(self) -> List[Dict]:
+        """
+        列出全部文档，最近更新的在前
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT doc_key, file_name, updated_at FROM documents ORDER BY updated_at DESC"
+            ).fetchall()
+        return [{"doc_key": doc_key, "file_name": file_name, "updated_at": updated_at}
+                for doc_key, file_name, updated_at in rows]
+
+    def find_collection(self, file_digest: str) -> Optional[str]:
+        """
+        根据文件摘要查找其所在集合，未记录时返回 None
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT collection_name FROM documents WHERE file_digest = ?", (file_digest,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def find_owner(self, collection_name: str) -> Optional[str]:
+        """
+        查找使用该集合的文档
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT doc_key FROM documents WHERE collection_name = ?", (collection_name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def resolve_collection(self, file_digest: str) -> str:
+        """
+        文件摘要 -> 集合名，未记录的文件沿用摘要作为集合名
+        """
+        return self.find_collection(file_digest) or file_digest
+
+    def get_chunks(self, doc_key: str) -> Dict[str, Tuple[str, Optional[int]]]:
+        """
+        获取文档的块记录 {节点id: (payload哈希, 块序号)}
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT point_id, payload_hash, chunk_index FROM chunks WHERE doc_key = ?", (doc_key,)
+            ).fetchall()
+        return {point_id: (payload_hash, chunk_index) for point_id, payload_hash, chunk_index in rows}
+
+    def mark_pending(self, collection_name: str, doc_key: str) -> None:
+        """
+        标记集合开始写入
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO pending VALUES (?, ?, ?)", (collection_name, doc_key, time.time())
+                )
+
+    def is_pending(self, collection_name: str) -> bool:
+        """
+        集合是否有未完成的写入
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM pending WHERE collection_name = ?", (collection_name,)
+            ).fetchone()
+        return row is not None
+
+    def clear_pending(self, collection_name: str) -> None:
+        """
+        清除集合的写入标记
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM pending WHERE collection_name = ?", (collection_name,))
+
+    def save_document(self, doc_key: str, collection_name: str, file_digest: str,
+                      chunks: Dict[str, Tuple[str, int]], file_name: str = None) -> None:
+        """
+        保存文档的当前版本，覆盖旧的块记录，同时清除集合的写入标记
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO documents (doc_key, collection_name, file_digest, updated_at, file_name) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (doc_key, collection_name, file_digest, time.time(), file_name)
+                )
+                self.conn.execute("DELETE FROM chunks WHERE doc_key = ?", (doc_key,))
+                self.conn.executemany(
+                    "INSERT INTO chunks (doc_key, point_id, payload_hash, chunk_index) VALUES (?, ?, ?, ?)",
+                    [(doc_key, point_id, payload_hash, chunk_index)
+                     for point_id, (payload_hash, chunk_index) in chunks.items()]
+                )
+                self.conn.execute("DELETE FROM pending WHERE collection_name = ?", (collection_name,))
+
+
+_document_manifest = None
+_document_manifest_lock = threading.Lock()
+
+
+def get_document_manifest() -> DocumentManifest:
+    """
+    获取进程内共享的文档清单
+    """
+    global _document_manifest
+    if _document_manifest is None:
+        with _document_manifest_lock:
+            if _document_manifest is None:
+                _document_manifest = DocumentManifest()
+    return _document_manifest
+
+
+if __name__ == "__main__":
+    # 测试
+    manifest = get_document_manifest()
+    print(manifest.list_documents())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-07 21:03
+# @Desc   : 向量持久化缓存，按 (模型, 维度, 文本哈希) 寻址
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Dict, List, Optional
+from loguru import logger
+
+from config import (
+    EMBEDDINGS_MODEL,
+    EMBEDDING_DIMENSION,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+)
+
+# sqlite 单条语句的参数个数有上限，批量查询时按此大小分组
+_SQL_PARAMS_LIMIT = 500
+
+
+class EmbeddingCache:
+    def __init__(self,
+                 db_path: str = EMBEDDING_CACHE_PATH,
+                 model: str = EMBEDDINGS_MODEL,
+                 dimension: int = EMBEDDING_DIMENSION,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+                 ) -> None:
+        self.db_path = db_path
+        self.model = model
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "dimension INTEGER NOT NULL, "
+            "text_hash BLOB NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "last_access REAL NOT NULL, "
+            "PRIMARY KEY (model, dimension, text_hash))"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def hash_text(text: str) -> bytes:
+        """
+        计算文本哈希，作为缓存键的一部分
+        """
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str]) -> Dict[int, List[float]]:
+        """
+        批量查询缓存，返回 {文本下标: 向量}，未命中的下标不在结果中
+        """
+        hash_to_indexes = {}
+        for index, text in enumerate(texts):
+            hash_to_indexes.setdefault(self.hash_text(text), []).append(index)
+
+        hits = {}
+        hashes = list(hash_to_indexes)
+        with self._lock:
+            for start in range(0, len(hashes), _SQL_PARAMS_LIMIT):
+                group = hashes[start:start + _SQL_PARAMS_LIMIT]
+                rows = self.conn.execute(
+                    "SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND dimension = ? AND text_hash IN ({','.join('?' * len(group))})",
+                    [self.model, self.dimension, *group]
+                ).fetchall()
+                for text_hash, vector in rows:
+                    embedding = array("f", vector).tolist()
+                    for index in hash_to_indexes[text_hash]:
+                        hits[index] = embedding
+                if rows:
+                    self.conn.executemany(
+                        "UPDATE embeddings SET last_access = ? "
+                        "WHERE model = ? AND dimension = ? AND text_hash = ?",
+                        [(time.time(), self.model, self.dimension, text_hash) for text_hash, _ in rows]
+                    )
+            self.conn.commit()
+        return hits
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]) -> None:
+        """
+        批量写入缓存，写入后超过容量则淘汰最久未访问的条目
+        """
+        now = time.time()
+        rows = [
+            (self.model, self.dimension, self.hash_text(text), array("f", embedding).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        """
+        淘汰超出容量的最久未访问条目，调用方需持有锁
+        """
+        count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+            logger.info(f"向量缓存淘汰 | 淘汰条数: {overflow}")
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    获取进程内共享的向量缓存，未启用缓存时返回 None
+    """
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+
+if __name__ == "__main__":
+    # 测试
+    cache = get_embedding_cache()
+    cache.put_many(["你好"], [[0.1] * cache.dimension])
+    print(cache.get_many(["你好", "世界"]).keys())
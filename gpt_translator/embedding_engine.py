@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-06 20:12
+# @Desc   : 批量并发向量化引擎
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
+from loguru import logger
+
+from kk_GPT import kk_GPT
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from token_counter import count_tokens_batch
+from config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_MAX_WORKERS,
+    EMBEDDING_MAX_RETRIES,
+)
+
+
+class EmbeddingEngine:
+    def __init__(self,
+                 gpt: kk_GPT = None,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_batch_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+                 max_workers: int = EMBEDDING_MAX_WORKERS,
+                 retries: int = EMBEDDING_MAX_RETRIES,
+                 retry_delay: float = 1,
+                 cache: EmbeddingCache = None,
+                 ) -> None:
+        self.gpt = gpt if gpt is not None else kk_GPT()
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.batch_size = max(1, batch_size)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_workers = max(1, max_workers)
+        self.retries = max(1, retries)
+        self.retry_delay = retry_delay
+
+    def build_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        按条数和 token 数切分批次，返回每个批次包含的文本下标。
+        单条文本超过 token 上限时独占一个批次。
+        """
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for index, tokens in enumerate(count_tokens_batch(texts)):
+            if batch and (len(batch) >= self.batch_size
+                          or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(index)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        向量化文本列表，结果与输入顺序一一对应。
+        先查向量缓存，只有未命中的文本才会请求 embeddings 接口。
+        """
+        if not texts:
+            return []
+
+        embeddings = [None] * len(texts)
+        if self.cache is not None:
+            for index, embedding in self.cache.get_many(texts).items():
+                embeddings[index] = embedding
+        missing = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            logger.info(f"向量化全部命中缓存 | 文本数: {len(texts)}")
+            return embeddings
+
+        missing_texts = [texts[index] for index in missing]
+        missing_embeddings = self._embed_texts(missing_texts)
+        for index, embedding in zip(missing, missing_embeddings):
+            embeddings[index] = embedding
+        if self.cache is not None:
+            self.cache.put_many(missing_texts, missing_embeddings)
+        return embeddings
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        分批并发请求 embeddings 接口
+        """
+        batches = self.build_batches(texts)
+        embeddings = [None] * len(texts)
+        logger.info(f"向量化开始 | 文本数: {len(texts)}, 批次数: {len(batches)}")
+
+        if len(batches) == 1 or self.max_workers == 1:
+            for batch in batches:
+                self._fill(embeddings, batch, self._embed_batch([texts[i] for i in batch]))
+        else:
+            max_workers = min(self.max_workers, len(batches))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self._embed_batch, [texts[i] for i in batch]): batch
+                    for batch in batches
+                }
+                for future in as_completed(futures):
+                    self._fill(embeddings, futures[future], future.result())
+
+        logger.success(f"向量化完成 | 文本数: {len(texts)}, 批次数: {len(batches)}")
+        return embeddings
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        向量化单个批次，失败后按 retries 重试，重试用完则抛出异常。
+        """
+        for i in range(self.retries):
+            try:
+                return self.gpt.get_embbeddings(texts)
+            except Exception as e:
+                logger.warning(f"批次向量化第{i + 1}次重试 | 批次大小: {len(texts)} 错误信息: {e}")
+                time.sleep(self.retry_delay)
+        raise RuntimeError(f"批次向量化失败，重试次数已用完 | 批次大小: {len(texts)}")
+
+    @staticmethod
+    def _fill(embeddings, batch, batch_embeddings):
+        """
+        将批次结果写回原始位置
+        """
+        if len(batch_embeddings) != len(batch):
+            raise RuntimeError(f"向量数量与文本数量不一致 | 向量数: {len(batch_embeddings)}, 文本数: {len(batch)}")
+        for index, embedding in zip(batch, batch_embeddings):
+            embeddings[index] = embedding
+
+
+if __name__ == "__main__":
+    # 测试
+    engine = EmbeddingEngine(batch_size=2)
+    texts = ["你好", "世界", "kk_GPT 翻译器", "向量化测试"]
+    print(engine.build_batches(texts))
+    embeddings = engine.embed(texts)
+    print(len(embeddings), len(embeddings[0]))
@@ -13,8 +13,16 @@ import sys
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(root_dir)
 
+import mmap
 import hashlib
 from typing import Dict, List, Any, Union
+from loguru import logger
+from config import FILE_HASH_ALGORITHM, FILE_HASH_BLOCK_SIZE, FILE_HASH_MMAP_THRESHOLD
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 
 class FileProcessor():
@@ -53,9 +61,21 @@ class FileProcessor():
         获取文件md5
         :return:
         """
-        file_bytes = self.get_file_bytes(self.file_path)
-        file_md5 = self.calculate_md5(file_bytes)
-        return file_md5
+        return self.calculate_file_digest(self.file_path, "md5")
+
+    def get_file_digest(self, algorithm: str = FILE_HASH_ALGORITHM):
+        """
+        获取文件摘要，作为集合名使用。
+        md5 摘要保持原样，与已有集合兼容；其他算法的摘要带算法前缀，避免与 md5 集合名混淆。
+        :return:
+        """
+        if algorithm == "xxhash" and xxhash is None:
+            logger.warning("未安装 xxhash，使用 blake2b 计算摘要")
+            algorithm = "blake2b"
+        digest = self.calculate_file_digest(self.file_path, algorithm)
+        if algorithm == "md5":
+            return digest
+        return f"{algorithm}_{digest}"
 
     @staticmethod
     def get_file_bytes(file_path: str):
@@ -67,6 +87,49 @@ class FileProcessor():
             file_bytes = f.read()
         return file_bytes
 
+    @staticmethod
+    def new_hash(algorithm: str):
+        """
+        创建哈希对象
+        :return:
+        """
+        if algorithm == "md5":
+            return hashlib.md5()
+        if algorithm == "xxhash" and xxhash is not None:
+            return xxhash.xxh3_128()
+        if algorithm == "blake2b":
+            return hashlib.blake2b(digest_size=16)
+        raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+
+    @staticmethod
+    def calculate_file_digest(file_path: str,
+                              algorithm: str = "md5",
+                              block_size: int = FILE_HASH_BLOCK_SIZE) -> str:
+        """
+        流式计算文件摘要，按固定大小分块读取，大文件使用 mmap，内存占用与文件大小无关
+        :return:
+        """
+        hasher = FileProcessor.new_hash(algorithm)
+        file_size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            if file_size >= FILE_HASH_MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    view = memoryview(mm)
+                    try:
+                        for start in range(0, file_size, block_size):
+                            hasher.update(view[start:start + block_size])
+                    finally:
+                        view.release()
+            else:
+                buffer = bytearray(block_size)
+                view = memoryview(buffer)
+                while True:
+                    n = f.readinto(buffer)
+                    if not n:
+                        break
+                    hasher.update(view[:n])
+        return hasher.hexdigest()
+
     @staticmethod
     def calculate_md5(input_data: Union[str, bytes]) -> str:
         """
@@ -14,12 +14,14 @@ root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(root_dir)
 
 
-import tiktoken
 import pdfplumber
-from typing import List, Dict, Any
-from config import CHUNK_SIZE, CHUNK_OVERLAP, API_KEY, BASE_URL
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator
+from config import CHUNK_SIZE, CHUNK_OVERLAP, API_KEY, BASE_URL, PDF_EXTRACT_WORKERS, PDF_PARALLEL_MIN_PAGES
+from token_counter import count_tokens
 from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from token_text_splitter import TokenTextSplitter
 
 
 
@@ -48,14 +50,31 @@ class FileProcessorHelper:
         func = stratege_mapping.get(self.file_extension)
         return func(self.file_path)
     
+    def iter_file_to_docs(self) -> Iterator:
+        """
+        逐页产出文件文档，不在内存中保留整个文件的解析结果
+        """
+        stratege_mapping = {
+            ".txt": self.get_txt_to_docs,
+            ".pdf": self.iter_pdf_to_docs,
+        }
+        func = stratege_mapping.get(self.file_extension)
+        yield from func(self.file_path)
+    
+    def iter_split_docs(self, docs: Iterable) -> Iterator:
+        """
+        逐页分割文档，产出切分后的文档块
+        """
+        for doc in docs:
+            yield from self.split_docs([doc])
+    
     def split_docs(self, docs):
         """
         分割文档
         """
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, 
-                                                       chunk_overlap=CHUNK_OVERLAP,
-                                                       length_function=self.tiktoken_len,
-                                                       )
+        text_splitter = TokenTextSplitter(chunk_size=CHUNK_SIZE,
+                                          chunk_overlap=CHUNK_OVERLAP,
+                                          )
         texts = [doc.page_content for doc in docs]
         metadatas = [doc.metadata for doc in docs]
         docs = text_splitter.create_documents(texts, metadatas)
@@ -63,32 +82,38 @@ class FileProcessorHelper:
     
     
     @staticmethod
-    def get_pdf_to_docs(file_path: str) -> List:
+    def get_pdf_to_docs(file_path: str, max_workers: int = PDF_EXTRACT_WORKERS) -> List:
         """
         获取pdf文件到文档
+        页数较多时按页码区间拆分给多个进程并行解析，结果按页码顺序合并
+        """
+        return list(FileProcessorHelper.iter_pdf_to_docs(file_path, max_workers))
+    
+    
+    @staticmethod
+    def iter_pdf_to_docs(file_path: str, max_workers: int = PDF_EXTRACT_WORKERS) -> Iterator:
+        """
+        按页码顺序逐页产出pdf文档
+        多进程解析时只保留有限个在途区间，已解析但未被消费的页面数量有上限
         """
-        file_name = os.path.basename(file_path)
-        
-        docs = []
         with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    doc = Document(
-                        page_content=page_text,
-                        metadata=dict(
-                            {
-                                "file_name": file_name,
-                                "page_number": page.page_number,
-                                "total_pages": len(pdf.pages),
-                            },
-                            **{
-                                k: pdf.metadata[k] for k in pdf.metadata if isinstance(pdf.metadata[k], (str, int)) 
-                            }
-                        )
-                    )
-                    docs.append(doc)
-        return docs
+            total_pages = len(pdf.pages)
+        
+        if max_workers <= 1 or total_pages < PDF_PARALLEL_MIN_PAGES:
+            yield from iter_pdf_pages(file_path, 0, total_pages)
+            return
+        
+        # 每个进程分到多个区间，避免个别慢页面拖住整个进程
+        step = max(1, -(-total_pages // (max_workers * 4)))
+        ranges = deque((start, min(start + step, total_pages)) for start in range(0, total_pages, step))
+        max_workers = min(max_workers, len(ranges))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = deque()
+            while ranges or futures:
+                while ranges and len(futures) < max_workers * 2:
+                    start, end = ranges.popleft()
+                    futures.append(executor.submit(extract_pdf_pages, file_path, start, end))
+                yield from futures.popleft().result()
     
     
     @staticmethod
@@ -110,11 +135,40 @@ class FileProcessorHelper:
         """
         获取文本长度
         """
-        encoding = tiktoken.get_encoding("cl100k_base")
-        tokens = encoding.encode(text,
-                                 disallowed_special=set()  # 禁用对所有特殊标记的检查
-                                 )
-        return len(tokens)
+        return count_tokens(text)
+
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> List:
+    """
+    解析pdf中 [start, end) 区间的页面，每次调用独立打开文件，可在子进程中执行
+    """
+    return list(iter_pdf_pages(file_path, start, end))
+
+
+def iter_pdf_pages(file_path: str, start: int, end: int) -> Iterator:
+    """
+    逐页解析pdf中 [start, end) 区间的页面
+    """
+    file_name = os.path.basename(file_path)
+    
+    with pdfplumber.open(file_path) as pdf:
+        metadata = {k: pdf.metadata[k] for k in pdf.metadata if isinstance(pdf.metadata[k], (str, int))}
+        total_pages = len(pdf.pages)
+        for page in pdf.pages[start:end]:
+            page_text = page.extract_text()
+            if page_text:
+                doc = Document(
+                    page_content=page_text,
+                    metadata=dict(
+                        {
+                            "file_name": file_name,
+                            "page_number": page.page_number,
+                            "total_pages": total_pages,
+                        },
+                        **metadata
+                    )
+                )
+                yield doc
 
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-08 20:41
+# @Desc   : 文件身份登记表，(路径, 大小, 修改时间) -> 文件摘要
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import threading
+from loguru import logger
+
+from file_processor import FileProcessor
+
+
+class FileRegistry:
+    def __init__(self) -> None:
+        # {绝对路径: (文件大小, 修改时间ns, 摘要)}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _identity(file_path: str):
+        """
+        获取文件身份：绝对路径、文件大小、修改时间
+        """
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime_ns
+
+    def register(self, file_path: str, digest: str) -> None:
+        """
+        登记文件摘要
+        """
+        path, size, mtime_ns = self._identity(file_path)
+        with self._lock:
+            self._entries[path] = (size, mtime_ns, digest)
+
+    def lookup(self, file_path: str):
+        """
+        查询文件摘要，文件未登记或已发生变化时返回 None
+        """
+        path, size, mtime_ns = self._identity(file_path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry and entry[0] == size and entry[1] == mtime_ns:
+            return entry[2]
+        return None
+
+    def get_digest(self, file_path: str) -> str:
+        """
+        获取文件摘要，只有未登记或已变化的文件才重新计算
+        """
+        digest = self.lookup(file_path)
+        if digest is None:
+            digest = FileProcessor(file_path).get_file_digest()
+            self.register(file_path, digest)
+            logger.debug(f"计算文件摘要 | file_path: {file_path}, digest: {digest}")
+        return digest
+
+
+# 进程内共享的文件登记表
+file_registry = FileRegistry()
+
+
+if __name__ == "__main__":
+    # 测试
+    file_path = os.path.join(root_dir, "data", "LangChain整体项目介绍与核心模块Model IO详解.pdf")
+    print(file_registry.get_digest(file_path))
+    print(file_registry.lookup(file_path))
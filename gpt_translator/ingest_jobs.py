@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-26 20:45
+# @Desc   : 后台入库任务：线程池并发入库多个文件，并记录每个文件的进度
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import time
+import uuid
+import threading
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from loguru import logger
+
+from utils import upload_files
+from file_registry import file_registry
+from config import INGEST_MAX_JOBS, INGEST_JOB_HISTORY
+
+# 任务状态
+JOB_QUEUED = "排队中"
+JOB_RUNNING = "入库中"
+JOB_DONE = "已完成"
+JOB_FAILED = "失败"
+
+
+class IngestJob:
+    def __init__(self, file_path: str, doc_key: str = None) -> None:
+        self.job_id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path)
+        # 要替换的文档标识，为空时作为新文档入库
+        self.doc_key = doc_key
+        self.status = JOB_QUEUED
+        self.progress = {
+            "pages_extracted": 0,
+            "chunks_embedded": 0,
+            "chunks_reused": 0,
+            "points_upserted": 0,
+            "points_deleted": 0,
+        }
+        self.uploaded_file_path = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def to_dict(self) -> Dict:
+        """
+        任务状态，供界面展示
+        """
+        end = self.finished_at or time.time()
+        return {
+            "文件": self.file_name,
+            "状态": self.status,
+            "已解析页数": self.progress["pages_extracted"],
+            "已向量化块数": self.progress["chunks_embedded"],
+            "已复用块数": self.progress["chunks_reused"],
+            "已写入节点数": self.progress["points_upserted"],
+            "耗时(秒)": round(end - self.started_at, 1) if self.started_at else 0.0,
+            "错误信息": self.error or "",
+        }
+
+
+class IngestJobManager:
+    """
+    提交的文件进入线程池排队，最多 max_workers 个文件同时入库，每个文件入库完成后即可被检索。
+    内容相同的文件或替换同一文档的任务串行执行：文档按内容摘要入库，内容相同的两个文件同时入库会写同一份数据，
+    同一文档的两个版本同时做增量更新也会互相覆盖。不相关的文件即使同名也并发执行。
+    进度由入库流水线回调更新，界面通过 get_jobs 轮询。
+    """
+    def __init__(self, max_workers: int = INGEST_MAX_JOBS, history: int = INGEST_JOB_HISTORY) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._history = history
+        # 锁的键 -> [锁, 使用该锁的任务数]，没有任务使用时删除
+        self._task_locks = {}
+
+    def submit(self, file_path: str, doc_key: str = None) -> IngestJob:
+        """
+        提交入库任务，同一文件已有未完成的任务时返回该任务
+        :param doc_key: 要替换的文档标识，为空时作为新文档入库
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.file_path == file_path and job.doc_key == doc_key and not job.finished:
+                    return job
+            job = IngestJob(file_path, doc_key)
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        logger.info(f"提交入库任务 | job_id: {job.job_id}, file_path: {file_path}")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_jobs(self, job_ids: List[str]) -> List[IngestJob]:
+        with self._lock:
+            return [self._jobs[job_id] for job_id in job_ids if job_id in self._jobs]
+
+    def _run(self, job):
+        """
+        执行入库任务，运行在线程池中
+        """
+        def on_progress(progress):
+            job.progress = progress
+
+        try:
+            # 在工作线程中计算摘要，大文件不阻塞提交；摘要会被缓存，入库时不再重复计算
+            lock_keys = [("digest", file_registry.get_digest(job.file_path))]
+            if job.doc_key:
+                lock_keys.append(("doc", job.doc_key))
+            with self._hold_locks(sorted(lock_keys)):
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                result = upload_files(job.file_path, progress_callback=on_progress, doc_key=job.doc_key)
+                if result.get('code') == 200:
+                    job.uploaded_file_path = result.get('data').get('uploaded_file_path')
+                    job.status = JOB_DONE
+                else:
+                    job.error = result.get('msg') or "入库失败"
+                    job.status = JOB_FAILED
+        except Exception as e:
+            logger.exception(f"入库任务失败 | job_id: {job.job_id}")
+            job.error = str(e)
+            job.status = JOB_FAILED
+        finally:
+            job.finished_at = time.time()
+        logger.info(f"入库任务结束 | job_id: {job.job_id}, 状态: {job.status}, 进度: {job.progress}")
+
+    @contextmanager
+    def _hold_locks(self, keys):
+        """
+        按固定顺序获取多把锁，避免两个任务交叉等待；锁按引用计数管理，最后一个使用它的任务结束后删除
+        """
+        with self._lock:
+            entries = [self._task_locks.setdefault(key, [threading.Lock(), 0]) for key in keys]
+            for entry in entries:
+                entry[1] += 1
+        try:
+            with ExitStack() as stack:
+                for lock, _ in entries:
+                    stack.enter_context(lock)
+                yield
+        finally:
+            with self._lock:
+                for key, entry in zip(keys, entries):
+                    entry[1] -= 1
+                    if entry[1] == 0:
+                        del self._task_locks[key]
+
+    def _prune(self):
+        """
+        只保留最近的若干个已完成任务，调用方需持有锁
+        """
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(0, len(finished) - self._history)]:
+            del self._jobs[job.job_id]
+
+
+_ingest_job_manager = None
+_ingest_job_manager_lock = threading.Lock()
+
+
+def get_ingest_job_manager() -> IngestJobManager:
+    """
+    获取进程内共享的入库任务管理器
+    """
+    global _ingest_job_manager
+    if _ingest_job_manager is None:
+        with _ingest_job_manager_lock:
+            if _ingest_job_manager is None:
+                _ingest_job_manager = IngestJobManager()
+    return _ingest_job_manager
+
+
+if __name__ == "__main__":
+    # 测试
+    manager = get_ingest_job_manager()
+    job = manager.submit(os.path.join(root_dir, "data", "LangChain整体项目介绍与核心模块Model IO详解.pdf"))
+    while not job.finished:
+        print(job.to_dict())
+        time.sleep(1)
+    print(job.to_dict())
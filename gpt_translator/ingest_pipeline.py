@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-10 21:26
+# @Desc   : 流式入库流水线：解析 → 切分 → 向量化 → 写入
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import queue
+import hashlib
+import threading
+from typing import Callable, Dict
+from loguru import logger
+
+from vector_store import BaseVectorStore, make_point_id, hash_payload, DOC_ID_FIELD
+from embedding_engine import EmbeddingEngine
+from file_processor_helper import FileProcessorHelper
+from lexical_index import LexicalIndex, get_lexical_index
+from config import INGEST_QUEUE_SIZE, INGEST_WINDOW_SIZE, HYBRID_SEARCH_ENABLED
+
+# 解析/切分阶段结束的标记
+_END = object()
+
+
+def chunk_point_id(doc_key, chunk_hash, occurrence=0):
+    """
+    由块内容哈希生成稳定的节点 id，同一文档中相同内容的块按出现次序区分
+    """
+    return make_point_id(doc_key, chunk_hash, occurrence)
+
+
+def hash_chunk_payload(payload):
+    """
+    计算用于变化检测的 payload 哈希，不包含块序号：
+    文档前部插入或删除块只会改变后续块的序号，不应让这些块都被重新写入
+    """
+    metadata = {key: value for key, value in (payload.get('metadata') or {}).items() if key != 'chunk_index'}
+    return hash_payload(dict(payload, metadata=metadata))
+
+
+def build_payloads(texts, metadatas, doc_id=None):
+    """
+    构建payloads，doc_id 不为空时写入 doc_id 字段，用于单集合多文档模式下按文档过滤
+    """
+    payloads = []
+    for text, metadata in zip(texts, metadatas):
+        payload = {
+            'page_content': text,
+            'metadata': metadata
+        }
+        if doc_id is not None:
+            payload[DOC_ID_FIELD] = doc_id
+        payloads.append(payload)
+    return payloads
+
+
+class IngestPipeline:
+    """
+    解析和切分在后台线程中逐页进行，产出的文档块放入有界队列；
+    主线程按窗口取出文档块，向量化后立即写入集合。
+    内存中最多同时存在 queue_size + window_size 个文档块，已写入的部分可以立即被检索。
+    
+    每个块的节点 id 由块内容哈希生成。传入文档上一版本的块记录时只做增量更新：
+    内容和 payload 都未变的块直接跳过，只有块序号变化的块只更新 payload，
+    其他 payload 变化（如页码变化）的块复用已有向量重新写入，
+    新增的块才会向量化，上一版本中不再存在的块最后统一删除。
+    
+    开启混合检索时同时建立 BM25 索引。每个块都会写入 BM25 索引（分词开销远小于向量化），
+    这样旧版本入库、尚无 BM25 索引的文档在增量更新后也能参与稀疏检索。
+    """
+    def __init__(self,
+                 qdrant: BaseVectorStore,
+                 embedding_engine: EmbeddingEngine = None,
+                 queue_size: int = INGEST_QUEUE_SIZE,
+                 window_size: int = INGEST_WINDOW_SIZE,
+                 progress_callback: Callable[[Dict[str, int]], None] = None,
+                 lexical_index: LexicalIndex = None,
+                 ) -> None:
+        self.qdrant = qdrant
+        self.embedding_engine = embedding_engine if embedding_engine is not None else EmbeddingEngine()
+        if lexical_index is None and HYBRID_SEARCH_ENABLED:
+            lexical_index = get_lexical_index()
+        self.lexical_index = lexical_index
+        self.queue_size = max(1, queue_size)
+        self.window_size = max(1, window_size)
+        self.progress_callback = progress_callback
+        self.progress = {
+            "pages_extracted": 0,
+            "chunks_embedded": 0,
+            "chunks_reused": 0,
+            "points_upserted": 0,
+            "points_deleted": 0,
+        }
+        # 本次入库的块记录 {节点id: (payload哈希, 块序号)}
+        self.chunks = {}
+        self.doc_key = None
+        self.doc_id = None
+        self.previous_chunks = {}
+        self._chunk_index = 0
+        self._occurrences = {}
+
+    def run(self,
+            collection_name: str,
+            file_processor_helper: FileProcessorHelper,
+            doc_key: str = None,
+            previous_chunks: Dict[str, str] = None,
+            doc_id: str = None,
+            ) -> int:
+        """
+        执行入库，返回文档的块数
+        :param doc_key: 文档标识，用于生成节点 id，默认使用集合名
+        :param previous_chunks: 文档上一版本的块记录 {节点id: (payload哈希, 块序号)}
+        :param doc_id: 写入 payload 的文档 id，多个文档共用一个集合时使用
+        """
+        self.doc_key = doc_key if doc_key is not None else collection_name
+        self.doc_id = doc_id
+        self.previous_chunks = previous_chunks or {}
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        stop_event = threading.Event()
+        producer = threading.Thread(
+            target=self._produce,
+            args=(file_processor_helper, chunk_queue, stop_event),
+            name=f"ingest-{collection_name}",
+            daemon=True
+        )
+        producer.start()
+
+        try:
+            while True:
+                window, finished = self._take_window(chunk_queue)
+                if window:
+                    self._consume(collection_name, window)
+                if finished:
+                    break
+        finally:
+            # 写入阶段出错时通知解析线程退出，并清空队列使其不再阻塞
+            stop_event.set()
+            while producer.is_alive():
+                try:
+                    chunk_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            producer.join()
+
+        # 删除上一版本中已不存在的块
+        removed_ids = [point_id for point_id in self.previous_chunks if point_id not in self.chunks]
+        if removed_ids:
+            self.qdrant.delete_points(collection_name, removed_ids)
+            if self.lexical_index is not None:
+                self.lexical_index.delete_chunks(self._lexical_doc_id(collection_name), removed_ids)
+            self._report("points_deleted", len(removed_ids))
+
+        logger.success(f"流式入库完成 | collection_name: {collection_name} 进度: {self.progress}")
+        return len(self.chunks)
+
+    def _produce(self, file_processor_helper, chunk_queue, stop_event):
+        """
+        解析/切分阶段，运行在后台线程
+        """
+        def pages():
+            for doc in file_processor_helper.iter_file_to_docs():
+                self._report("pages_extracted", 1)
+                yield doc
+
+        try:
+            for chunk in file_processor_helper.iter_split_docs(pages()):
+                if not self._put(chunk_queue, chunk, stop_event):
+                    return
+            self._put(chunk_queue, _END, stop_event)
+        except Exception as e:
+            logger.error(f"解析文档失败 | file_path: {file_processor_helper.file_path} 错误信息: {e}")
+            self._put(chunk_queue, e, stop_event)
+
+    @staticmethod
+    def _put(chunk_queue, item, stop_event):
+        """
+        放入队列，队列满时阻塞等待，收到停止信号时返回 False
+        """
+        while not stop_event.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _take_window(self, chunk_queue):
+        """
+        从队列中取出至多 window_size 个文档块，返回 (文档块列表, 是否已取完)
+        """
+        window = []
+        while len(window) < self.window_size:
+            # 已有数据时不再等待，尽快写入使其可被检索
+            block = not window
+            try:
+                item = chunk_queue.get(block=block, timeout=None if block else 0)
+            except queue.Empty:
+                break
+            if item is _END:
+                return window, True
+            if isinstance(item, Exception):
+                raise item
+            window.append(item)
+        return window, False
+
+    def _consume(self, collection_name, window):
+        """
+        向量化并写入一个窗口的文档块
+        """
+        texts = [doc.page_content for doc in window]
+        metadatas = []
+        for doc in window:
+            metadatas.append(dict(doc.metadata, chunk_index=self._chunk_index))
+            self._chunk_index += 1
+        payloads = build_payloads(texts, metadatas, self.doc_id)
+
+        ids = []
+        new_indexes = []  # 需要向量化的块
+        moved_indexes = []  # 内容未变但 payload 变化的块
+        reindexed_indexes = []  # 只有块序号变化的块
+        for index, (text, payload) in enumerate(zip(texts, payloads)):
+            chunk_hash = hashlib.md5(text.encode('utf-8')).hexdigest()
+            occurrence = self._occurrences.get(chunk_hash, 0)
+            self._occurrences[chunk_hash] = occurrence + 1
+            point_id = chunk_point_id(self.doc_key, chunk_hash, occurrence)
+            payload_hash = hash_chunk_payload(payload)
+            chunk_index = payload['metadata']['chunk_index']
+            self.chunks[point_id] = (payload_hash, chunk_index)
+            ids.append(point_id)
+
+            previous = self.previous_chunks.get(point_id)
+            if previous is None:
+                new_indexes.append(index)
+            elif previous[0] != payload_hash:
+                moved_indexes.append(index)
+            elif previous[1] != chunk_index:
+                reindexed_indexes.append(index)
+        self._report("chunks_reused", len(window) - len(new_indexes))
+
+        if reindexed_indexes:
+            self.qdrant.set_payloads(
+                collection_name,
+                [ids[i] for i in reindexed_indexes],
+                [payloads[i] for i in reindexed_indexes]
+            )
+            logger.debug(f"更新块序号 | collection_name: {collection_name}, 节点数: {len(reindexed_indexes)}")
+
+        vectors = {}
+        if moved_indexes:
+            vectors = self.qdrant.retrieve_vectors(collection_name, [ids[i] for i in moved_indexes])
+            # 集合中缺失的节点按新块处理
+            new_indexes.extend(i for i in moved_indexes if ids[i] not in vectors)
+        if new_indexes:
+            embeddings = self.embedding_engine.embed([texts[i] for i in new_indexes])
+            vectors.update(zip([ids[i] for i in new_indexes], embeddings))
+            self._report("chunks_embedded", len(new_indexes))
+
+        upsert_indexes = sorted(set(new_indexes) | set(moved_indexes))
+        if upsert_indexes:
+            self.qdrant.add_points(
+                collection_name,
+                [vectors[ids[i]] for i in upsert_indexes],
+                [payloads[i] for i in upsert_indexes],
+                ids=[ids[i] for i in upsert_indexes]
+            )
+            self._report("points_upserted", len(upsert_indexes))
+        # 向量写入成功后再写 BM25 索引，保证稀疏检索命中的块在向量库中存在
+        if self.lexical_index is not None:
+            self.lexical_index.add_chunks(self._lexical_doc_id(collection_name), ids, payloads)
+
+    def _lexical_doc_id(self, collection_name):
+        """
+        BM25 索引中的文档 id，与 DocumentIndex 的索引键一致
+        """
+        return self.doc_id if self.doc_id is not None else collection_name
+
+    def _report(self, key, count):
+        """
+        更新进度并回调
+        """
+        self.progress[key] += count
+        if self.progress_callback is not None:
+            self.progress_callback(dict(self.progress))
@@ -10,18 +10,19 @@
 """
 import os
 import sys
-import openai
 from loguru import logger
 from dotenv import load_dotenv
 
 from file_processor_helper import FileProcessorHelper
+from llm_client import get_llm_client, get_async_llm_client, get_provider_semaphore
 from config import API_KEY, BASE_URL, EMBEDDINGS_MODEL
 
 load_dotenv()
 
 class kk_GPT:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=API_KEY, base_url=BASE_URL)
+        # 共享客户端，创建 kk_GPT 不再新建连接池
+        self.client = get_llm_client(BASE_URL, API_KEY)
         
     def get_completions(
         self,
@@ -58,6 +59,64 @@ class kk_GPT:
         embeddings = [data.embedding for data in response.data]
         return embeddings
     
+    async def aget_completions(
+        self,
+        messages,
+        model,
+        max_tokens=4096,
+        temperature=0.5,
+        stream=True
+    ):
+        """
+        get_completions 的异步版本，stream=True 时返回异步生成器，用 async for 逐个读取
+        同一服务同时进行的请求数受信号量限制，流式请求在整个输出期间占用一个名额
+        """
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        elif not isinstance(messages, list):
+            return f"messages 必须是字符串或消息列表，当前类型为 {type(messages)}"
+        
+        if stream:
+            return self._astream_completions(messages, model, max_tokens, temperature)
+        
+        async with get_provider_semaphore(BASE_URL):
+            response = await get_async_llm_client(BASE_URL, API_KEY).chat.completions.create(
+                messages=messages,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=False
+            )
+        logger.success(f"非流式输出 | : total_tokens={response.usage.total_tokens}"
+                       f"= prompt_tokens: {response.usage.prompt_tokens}"
+                       f"+ completion_tokens: {response.usage.completion_tokens}")
+        return response.choices[0].message.content
+    
+    async def _astream_completions(self, messages, model, max_tokens, temperature):
+        """
+        流式输出的异步生成器
+        """
+        async with get_provider_semaphore(BASE_URL):
+            response = await get_async_llm_client(BASE_URL, API_KEY).chat.completions.create(
+                messages=messages,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            )
+            async for chunk in response:
+                yield chunk
+    
+    async def aget_embbeddings(self, input):
+        """
+        get_embbeddings 的异步版本
+        """
+        async with get_provider_semaphore(BASE_URL):
+            response = await get_async_llm_client(BASE_URL, API_KEY).embeddings.create(
+                input=input, model=EMBEDDINGS_MODEL)
+        embeddings = [data.embedding for data in response.data]
+        return embeddings
+    
 
 
 if __name__ == "__main__":
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-23 21:15
+# @Desc   : BM25 稀疏检索索引，入库时与向量一起建立，用于弥补向量检索对精确词（型号、价格、编码）不敏感的问题
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import re
+import math
+import json
+import sqlite3
+import threading
+from collections import Counter, namedtuple
+from typing import Dict, List
+from loguru import logger
+
+from vector_store import DOC_ID_FIELD
+from config import LEXICAL_INDEX_PATH, BM25_K1, BM25_B
+
+try:
+    import jieba
+    jieba.setLogLevel(60)
+except ImportError:
+    jieba = None
+
+# 检索结果，与 Qdrant 的 ScoredPoint 一样提供 id、score、payload 属性
+LexicalScoredPoint = namedtuple("LexicalScoredPoint", ["id", "score", "payload"])
+
+# 连续的中日韩字符、连续的字母数字（允许 . - _ 连接，保留型号、价格、编码的完整形式）
+_TOKEN_PATTERN = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[0-9a-zA-Z]+(?:[._\-][0-9a-zA-Z]+)*")
+_CJK_PATTERN = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+# sqlite 单条语句的参数个数有上限，批量操作时按此大小分组
+_SQL_PARAMS_LIMIT = 500
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中英文混合分词，英文和数字转为小写。
+    中文优先使用 jieba 的搜索引擎模式；未安装 jieba 时中文按单字和相邻二字切分。
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        word = match.group()
+        if not _CJK_PATTERN.match(word):
+            word = word.lower()
+            tokens.append(word)
+            # 带连接符的词同时按各部分索引，如 gpt-4o 也能被 gpt 命中
+            if len(word) > 1 and re.search(r"[._\-]", word):
+                tokens.extend(part for part in re.split(r"[._\-]", word) if part)
+        elif jieba is not None:
+            tokens.extend(token for token in jieba.lcut_for_search(word) if token.strip())
+        else:
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    倒排索引存在 sqlite 中：postings 记录每个词在每个块中的词频，chunks 记录块长度和 payload。
+    文档 id 与 DocumentIndex 的索引键一致，检索时只统计所选文档，IDF 和平均长度也只在所选文档内计算。
+    """
+    def __init__(self, db_path: str = LEXICAL_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B) -> None:
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "doc_id TEXT NOT NULL, "
+            "point_id TEXT NOT NULL, "
+            "length INTEGER NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "PRIMARY KEY (doc_id, point_id))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, "
+            "doc_id TEXT NOT NULL, "
+            "point_id TEXT NOT NULL, "
+            "tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, doc_id, point_id))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_point ON postings (doc_id, point_id)")
+        self.conn.commit()
+
+    def add_chunks(self, doc_id: str, point_ids: List[str], payloads: List[Dict]) -> None:
+        """
+        写入文档块，已存在的块会被覆盖
+        """
+        point_ids = [str(point_id) for point_id in point_ids]
+        chunk_rows = []
+        posting_rows = []
+        for point_id, payload in zip(point_ids, payloads):
+            term_counts = Counter(tokenize(payload.get("page_content", "")))
+            chunk_rows.append((doc_id, point_id, sum(term_counts.values()), json.dumps(payload, ensure_ascii=False)))
+            posting_rows.extend((term, doc_id, point_id, tf) for term, tf in term_counts.items())
+        with self._lock:
+            with self.conn:
+                self._delete(doc_id, point_ids)
+                self.conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)", chunk_rows)
+                self.conn.executemany("INSERT OR REPLACE INTO postings VALUES (?, ?, ?, ?)", posting_rows)
+
+    def missing_documents(self, doc_ids: List[str]) -> List[str]:
+        """
+        返回没有任何块的文档 id
+        """
+        doc_ids = list(dict.fromkeys(doc_ids))
+        if not doc_ids:
+            return []
+        with self._lock:
+            indexed = {row[0] for row in self.conn.execute(
+                f"SELECT DISTINCT doc_id FROM chunks WHERE doc_id IN ({','.join('?' * len(doc_ids))})", doc_ids)}
+        return [doc_id for doc_id in doc_ids if doc_id not in indexed]
+
+    def delete_chunks(self, doc_id: str, point_ids: List[str]) -> None:
+        """
+        删除文档块
+        """
+        with self._lock:
+            with self.conn:
+                self._delete(doc_id, [str(point_id) for point_id in point_ids])
+
+    def delete_document(self, doc_id: str) -> None:
+        """
+        删除文档的全部块
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                self.conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+
+    def search(self, doc_ids: List[str], query: str, limit: int = 3) -> List[LexicalScoredPoint]:
+        """
+        在所选文档中做 BM25 检索，结果按分数降序排列
+        """
+        terms = set(tokenize(query))
+        doc_ids = list(dict.fromkeys(doc_ids))
+        if not terms or not doc_ids or limit <= 0:
+            return []
+        doc_placeholders = ",".join("?" * len(doc_ids))
+
+        with self._lock:
+            chunks_count, total_length = self.conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE doc_id IN ({doc_placeholders})",
+                doc_ids
+            ).fetchone()
+            if not chunks_count:
+                return []
+            avg_length = total_length / chunks_count or 1.0
+
+            scores = {}
+            for term in terms:
+                postings = self.conn.execute(
+                    "SELECT p.doc_id, p.point_id, p.tf, c.length FROM postings p "
+                    "JOIN chunks c ON p.doc_id = c.doc_id AND p.point_id = c.point_id "
+                    f"WHERE p.term = ? AND p.doc_id IN ({doc_placeholders})",
+                    [term, *doc_ids]
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (chunks_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, point_id, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    key = (doc_id, point_id)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            results = []
+            for (doc_id, point_id), score in top:
+                payload = self.conn.execute(
+                    "SELECT payload FROM chunks WHERE doc_id = ? AND point_id = ?", (doc_id, point_id)
+                ).fetchone()[0]
+                # 与向量检索结果一样在 payload 中带上索引键
+                payload = dict(json.loads(payload), **{DOC_ID_FIELD: doc_id})
+                results.append(LexicalScoredPoint(id=point_id, score=score, payload=payload))
+        return results
+
+    def _delete(self, doc_id, point_ids):
+        """
+        删除块及其倒排记录，调用方需持有锁
+        """
+        for start in range(0, len(point_ids), _SQL_PARAMS_LIMIT):
+            group = point_ids[start:start + _SQL_PARAMS_LIMIT]
+            placeholders = ",".join("?" * len(group))
+            self.conn.execute(
+                f"DELETE FROM postings WHERE doc_id = ? AND point_id IN ({placeholders})", [doc_id, *group])
+            self.conn.execute(
+                f"DELETE FROM chunks WHERE doc_id = ? AND point_id IN ({placeholders})", [doc_id, *group])
+
+
+_lexical_index = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    """
+    获取进程内共享的 BM25 索引
+    """
+    global _lexical_index
+    if _lexical_index is None:
+        with _lexical_index_lock:
+            if _lexical_index is None:
+                if jieba is None:
+                    logger.warning("未安装 jieba，中文按单字和二字切分建立 BM25 索引")
+                _lexical_index = LexicalIndex()
+    return _lexical_index
+
+
+if __name__ == "__main__":
+    # 测试
+    print(tokenize("GLM-4-Plus 的价格是每百万 tokens 50 元，型号 A100_80G"))
+    print(get_lexical_index().search(["test_doc"], "GLM-4-Plus 价格", limit=3))
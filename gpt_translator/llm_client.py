@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-27 20:20
+# @Desc   : 进程内共享的大模型客户端，按 (base_url, api_key) 复用连接池；异步客户端按服务限制并发数
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import asyncio
+import weakref
+import threading
+
+import httpx
+import openai
+from loguru import logger
+
+from config import (
+    LLM_TIMEOUT,
+    LLM_CONNECT_TIMEOUT,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_HTTP2,
+    LLM_MAX_CONCURRENCY,
+)
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+_clients = {}
+_clients_lock = threading.Lock()
+# 异步客户端和信号量绑定事件循环，按事件循环分别缓存，事件循环关闭回收后随之释放
+_async_clients = weakref.WeakKeyDictionary()
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _http_client_options():
+    """
+    连接池参数：限制连接数、保持长连接，安装了 h2 时启用 HTTP/2
+    """
+    return {
+        "limits": httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        "http2": LLM_HTTP2 and _HTTP2_AVAILABLE,
+    }
+
+
+def get_llm_client(base_url=None, api_key=None) -> openai.OpenAI:
+    """
+    获取共享的 OpenAI 客户端，相同 (base_url, api_key) 的调用复用同一个连接池，避免每次请求重复建立连接和 TLS 握手
+    """
+    key = (base_url, api_key)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                options = _http_client_options()
+                client = openai.OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=httpx.Client(**options)
+                )
+                _clients[key] = client
+                logger.info(f"创建大模型客户端 | base_url: {base_url}, http2: {options['http2']}")
+    return client
+
+
+def get_async_llm_client(base_url=None, api_key=None) -> openai.AsyncOpenAI:
+    """
+    获取当前事件循环中共享的 AsyncOpenAI 客户端，需在协程中调用
+    """
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    key = (base_url, api_key)
+    client = clients.get(key)
+    if client is None:
+        options = _http_client_options()
+        client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.AsyncClient(**options)
+        )
+        clients[key] = client
+        logger.info(f"创建异步大模型客户端 | base_url: {base_url}, http2: {options['http2']}")
+    return client
+
+
+def get_provider_semaphore(base_url=None) -> asyncio.Semaphore:
+    """
+    获取服务对应的信号量，同一服务同时进行的请求数不超过 LLM_MAX_CONCURRENCY，需在协程中调用
+    """
+    semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    semaphore = semaphores.get(base_url)
+    if semaphore is None:
+        semaphore = semaphores[base_url] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return semaphore
+
+
+if __name__ == "__main__":
+    # 测试
+    from config import API_KEY, BASE_URL
+    print(get_llm_client(BASE_URL, API_KEY) is get_llm_client(BASE_URL, API_KEY))
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-20 21:05
+# @Desc   : 进程内本地向量索引，NumPy 矩阵 + 内存映射文件持久化
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import namedtuple
+
+import numpy as np
+from loguru import logger
+
+from vector_store import BaseVectorStore, payload_point_id, DOC_ID_FIELD
+from config import (
+    EMBEDDING_DIMENSION,
+    LOCAL_VECTOR_STORE_DIR,
+    LOCAL_IVF_ENABLED,
+    LOCAL_IVF_MIN_POINTS,
+    LOCAL_IVF_NPROBE,
+)
+
+# 检索结果，与 Qdrant 的 ScoredPoint 一样提供 id、score、payload 属性
+LocalScoredPoint = namedtuple("LocalScoredPoint", ["id", "score", "payload"])
+
+# 失效行超过该数量且超过总行数一半时压缩向量文件
+_COMPACT_MIN_DEAD_ROWS = 1000
+# 新增行数超过建立 IVF 时行数的该比例后重建 IVF
+_IVF_REBUILD_RATIO = 0.2
+# sqlite 单条语句的参数个数有上限，批量查询时按此大小分组
+_SQL_PARAMS_LIMIT = 500
+
+
+def _normalize(vectors):
+    """
+    向量按行归一化，归一化后点积即余弦相似度
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class _IvfIndex:
+    """
+    倒排聚类索引：球面 k-means 将向量分到 nlist 个聚类，检索时只计算最近的 nprobe 个聚类中的向量
+    """
+    def __init__(self, matrix, live, iterations=10, seed=0):
+        rows = np.nonzero(live)[0]
+        nlist = max(1, int(np.sqrt(len(rows))))
+        rng = np.random.default_rng(seed)
+
+        # 在样本上训练聚类中心
+        sample = rows if len(rows) <= nlist * 64 else rng.choice(rows, nlist * 64, replace=False)
+        sample_vectors = np.asarray(matrix[np.sort(sample)])
+        centroids = sample_vectors[rng.choice(len(sample_vectors), nlist, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(sample_vectors @ centroids.T, axis=1)
+            for i in range(nlist):
+                members = sample_vectors[assignments == i]
+                if len(members):
+                    centroids[i] = members.sum(axis=0)
+            centroids = _normalize(centroids)
+
+        # 分块分配所有向量，避免一次性读入整个矩阵
+        assignments = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), 8192):
+            block = np.asarray(matrix[rows[start:start + 8192]])
+            assignments[start:start + 8192] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        self.lists = np.split(rows[order], np.searchsorted(assignments[order], np.arange(1, nlist)))
+        self.centroids = centroids
+        self.built_rows = matrix.shape[0]
+
+    def candidates(self, query_vector, nprobe):
+        """
+        返回最近的 nprobe 个聚类中的行号
+        """
+        nprobe = min(nprobe, len(self.lists))
+        probes = np.argpartition(-(self.centroids @ query_vector), nprobe - 1)[:nprobe]
+        return np.concatenate([self.lists[i] for i in probes])
+
+
+class _LocalCollection:
+    def __init__(self, name, path, dimension):
+        self.name = name
+        self.path = path
+        self.dimension = dimension
+        self.row_ids = []  # 行号 -> 节点 id，失效行为 None
+        self.row_docs = []  # 行号 -> 文档 id
+        self.id_to_row = {}
+        self.live = np.zeros(0, dtype=bool)
+        self.ivf = None
+        self._matrix = None
+
+    @property
+    def rows(self):
+        return len(self.row_ids)
+
+    @property
+    def points_count(self):
+        return len(self.id_to_row)
+
+    def matrix(self):
+        """
+        以只读内存映射的方式打开向量文件，文件增长后重新映射
+        """
+        if self._matrix is None or self._matrix.shape[0] != self.rows:
+            if self.rows:
+                self._matrix = np.memmap(self.path, dtype=np.float32, mode="r", shape=(self.rows, self.dimension))
+            else:
+                self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+        return self._matrix
+
+
+class LocalVectorStore(BaseVectorStore):
+    """
+    每个集合的向量按行追加写入一个 float32 文件，检索时以内存映射方式读取；
+    节点 id、行号和 payload 存在 sqlite 中。
+    默认对全部向量做精确点积检索（argpartition 取 top-k），开启 IVF 后大集合只检索最近的若干聚类。
+    """
+    def __init__(self, store_dir: str = LOCAL_VECTOR_STORE_DIR, dimension: int = EMBEDDING_DIMENSION) -> None:
+        self.store_dir = store_dir
+        self.size = dimension
+        self._lock = threading.RLock()
+        self._collections = {}
+
+        os.makedirs(store_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(store_dir, "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS collections ("
+            "name TEXT PRIMARY KEY, "
+            "dimension INTEGER NOT NULL, "
+            "file_name TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS points ("
+            "collection TEXT NOT NULL, "
+            "point_id TEXT NOT NULL, "
+            "row INTEGER NOT NULL, "
+            "chunk_index INTEGER, "
+            "payload TEXT NOT NULL, "
+            "doc_id TEXT, "
+            "PRIMARY KEY (collection, point_id))"
+        )
+        # 旧版本的索引没有 doc_id 列
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(points)")]
+        if "doc_id" not in columns:
+            self.conn.execute("ALTER TABLE points ADD COLUMN doc_id TEXT")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_points_order ON points (collection, chunk_index, row)")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_points_doc ON points (collection, doc_id)")
+        self.conn.commit()
+
+    def _get(self, collection_name):
+        """
+        获取集合，首次访问时从磁盘加载，集合不存在时返回 None
+        """
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is not None:
+                return collection
+            row = self.conn.execute(
+                "SELECT dimension, file_name FROM collections WHERE name = ?", (collection_name,)
+            ).fetchone()
+            if row is None:
+                return None
+            dimension, file_name = row
+            collection = _LocalCollection(collection_name, os.path.join(self.store_dir, file_name), dimension)
+            rows = os.path.getsize(collection.path) // (dimension * 4) if os.path.exists(collection.path) else 0
+            collection.row_ids = [None] * rows
+            collection.row_docs = [None] * rows
+            collection.live = np.zeros(rows, dtype=bool)
+            for point_id, point_row, doc_id in self.conn.execute(
+                    "SELECT point_id, row, doc_id FROM points WHERE collection = ?", (collection_name,)):
+                collection.row_ids[point_row] = point_id
+                collection.row_docs[point_row] = doc_id
+                collection.id_to_row[point_id] = point_row
+                collection.live[point_row] = True
+            self._collections[collection_name] = collection
+            return collection
+
+    def _require(self, collection_name):
+        collection = self._get(collection_name)
+        if collection is None:
+            raise ValueError(f"Collection {collection_name} not found")
+        return collection
+
+    def health_check(self):
+        return True
+
+    def list_all_collections_names(self):
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT name FROM collections")]
+
+    def get_points_count(self, collection_name):
+        collection = self._get(collection_name)
+        if collection is not None:
+            logger.success(f"库里已有该集合 | collection_name：{collection_name} points_count：{collection.points_count}")
+            return collection.points_count
+        try:
+            self.create_collection(collection_name)
+        except Exception as e:
+            logger.error(f"创建集合失败 | collection_name：{collection_name} 错误信息: {e}")
+            return -1
+        logger.success(f"创建集合成功 | collection_name：{collection_name} points_count: 0")
+        return 0
+
+    def create_collection(self, collection_name):
+        with self._lock:
+            if self.collection_exists(collection_name):
+                self.delete_collection(collection_name)
+            file_name = hashlib.md5(collection_name.encode("utf-8")).hexdigest() + ".f32"
+            open(os.path.join(self.store_dir, file_name), "wb").close()
+            with self.conn:
+                self.conn.execute("INSERT INTO collections VALUES (?, ?, ?)", (collection_name, self.size, file_name))
+        return True
+
+    def collection_exists(self, collection_name):
+        return self._get(collection_name) is not None
+
+    def delete_collection(self, collection_name):
+        with self._lock:
+            collection = self._get(collection_name)
+            if collection is None:
+                return False
+            self._collections.pop(collection_name, None)
+            with self.conn:
+                self.conn.execute("DELETE FROM points WHERE collection = ?", (collection_name,))
+                self.conn.execute("DELETE FROM collections WHERE name = ?", (collection_name,))
+            collection._matrix = None
+            if os.path.exists(collection.path):
+                os.remove(collection.path)
+        return True
+
+    def add_points(self, collection_name, vectors, payloads, ids=None, **kwargs):
+        """
+        写入节点，已存在的 id 会被覆盖。分批、并发等 Qdrant 专用参数在本地后端中忽略
+        """
+        if ids is None:
+            ids = [payload_point_id(collection_name, payload) for payload in payloads]
+        if not ids:
+            return True
+        ids = [str(point_id) for point_id in ids]
+        vectors = _normalize(vectors)
+
+        with self._lock:
+            collection = self._require(collection_name)
+            start_row = collection.rows
+            with open(collection.path, "ab") as f:
+                f.write(vectors.tobytes())
+            collection.live = np.concatenate([collection.live, np.ones(len(ids), dtype=bool)])
+            for offset, point_id in enumerate(ids):
+                old_row = collection.id_to_row.get(point_id)
+                if old_row is not None:
+                    collection.live[old_row] = False
+                    collection.row_ids[old_row] = None
+                collection.row_ids.append(point_id)
+                collection.row_docs.append(payloads[offset].get(DOC_ID_FIELD))
+                collection.id_to_row[point_id] = start_row + offset
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO points (collection, point_id, row, chunk_index, payload, doc_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (collection_name, point_id, collection.id_to_row[point_id],
+                         payload.get("metadata", {}).get("chunk_index"), json.dumps(payload, ensure_ascii=False),
+                         payload.get(DOC_ID_FIELD))
+                        for point_id, payload in zip(ids, payloads)
+                    ]
+                )
+            self._maybe_compact(collection)
+        return True
+
+    def retrieve_vectors(self, collection_name, ids):
+        with self._lock:
+            collection = self._require(collection_name)
+            matrix = collection.matrix()
+            rows = {str(point_id): collection.id_to_row.get(str(point_id)) for point_id in ids}
+        return {point_id: matrix[row].tolist() for point_id, row in rows.items() if row is not None}
+
+    def delete_points(self, collection_name, ids):
+        ids = [str(point_id) for point_id in ids]
+        with self._lock:
+            collection = self._require(collection_name)
+            for point_id in ids:
+                row = collection.id_to_row.pop(point_id, None)
+                if row is not None:
+                    collection.live[row] = False
+                    collection.row_ids[row] = None
+            with self.conn:
+                for start in range(0, len(ids), _SQL_PARAMS_LIMIT):
+                    group = ids[start:start + _SQL_PARAMS_LIMIT]
+                    self.conn.execute(
+                        f"DELETE FROM points WHERE collection = ? AND point_id IN ({','.join('?' * len(group))})",
+                        [collection_name, *group]
+                    )
+            self._maybe_compact(collection)
+        return True
+
+    def set_payloads(self, collection_name, ids, payloads):
+        """
+        覆盖 payload，节点的行号和文档 id 不变
+        """
+        with self._lock:
+            collection = self._require(collection_name)
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE points SET chunk_index = ?, payload = ? WHERE collection = ? AND point_id = ?",
+                    [
+                        (payload.get("metadata", {}).get("chunk_index"), json.dumps(payload, ensure_ascii=False),
+                         collection_name, str(point_id))
+                        for point_id, payload in zip(ids, payloads)
+                        if str(point_id) in collection.id_to_row
+                    ]
+                )
+        return True
+
+    def count_points(self, collection_name, doc_id=None):
+        with self._lock:
+            collection = self._require(collection_name)
+            if doc_id is None:
+                return collection.points_count
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM points WHERE collection = ? AND doc_id = ?", (collection_name, doc_id)
+            ).fetchone()[0]
+
+    def delete_document(self, collection_name, doc_id):
+        with self._lock:
+            self._require(collection_name)
+            point_ids = [row[0] for row in self.conn.execute(
+                "SELECT point_id FROM points WHERE collection = ? AND doc_id = ?", (collection_name, doc_id))]
+            return self.delete_points(collection_name, point_ids)
+
+    def iter_points(self, collection_name, doc_id=None, batch_size=256):
+        """
+        按行号分页逐个产出 (节点id, 向量, payload)，doc_id 不为空时只产出该文档的节点
+        """
+        self._require(collection_name)
+        doc_clause = "" if doc_id is None else "AND doc_id = ? "
+        doc_params = () if doc_id is None else (doc_id,)
+        last_row = -1
+        while True:
+            with self._lock:
+                collection = self._require(collection_name)
+                matrix = collection.matrix()
+                rows = self.conn.execute(
+                    f"SELECT row, point_id, payload FROM points WHERE collection = ? {doc_clause}AND row > ? "
+                    "ORDER BY row LIMIT ?",
+                    (collection_name, *doc_params, last_row, batch_size)
+                ).fetchall()
+                vectors = np.asarray(matrix[[row[0] for row in rows]]) if rows else []
+            for (_, point_id, payload), vector in zip(rows, vectors):
+                yield point_id, vector.tolist(), json.loads(payload)
+            if len(rows) < batch_size:
+                break
+            last_row = rows[-1][0]
+
+    def search(self, collection_name, query_vector, limit=3, timeout=None, search_params=None, doc_ids=None):
+        """
+        检索与查询向量最相似的点，timeout 和 search_params 在本地后端中忽略
+        doc_ids 不为空时只检索这些文档的节点
+        """
+        query_vector = _normalize(query_vector)
+        with self._lock:
+            collection = self._require(collection_name)
+            self._maybe_build_ivf(collection)
+            matrix = collection.matrix()
+            live = collection.live.copy()
+            row_ids = list(collection.row_ids)
+            ivf = collection.ivf
+            if doc_ids:
+                doc_ids = {doc_ids} if isinstance(doc_ids, str) else set(doc_ids)
+                live &= np.fromiter((doc_id in doc_ids for doc_id in collection.row_docs), dtype=bool, count=len(live))
+
+        if ivf is not None:
+            # 建立 IVF 之后新增的行全部参与计算
+            rows = np.concatenate([ivf.candidates(query_vector, LOCAL_IVF_NPROBE),
+                                   np.arange(ivf.built_rows, matrix.shape[0])])
+            rows = np.sort(rows[live[rows]])
+        else:
+            rows = np.nonzero(live)[0]
+        if not len(rows) or limit <= 0:
+            return []
+
+        scores = (np.asarray(matrix) @ query_vector)[rows] if ivf is None else np.asarray(matrix[rows]) @ query_vector
+        k = min(limit, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        point_ids = [row_ids[rows[i]] for i in top]
+        payloads = self._load_payloads(collection_name, point_ids)
+        return [
+            LocalScoredPoint(id=point_id, score=float(scores[i]), payload=payloads.get(point_id, {}))
+            for point_id, i in zip(point_ids, top)
+        ]
+
+    def iter_collection_content(self, collection_name, doc_id=None, batch_size=256):
+        """
+        按块顺序逐个产出集合中的 page_content，按 (块序号, 行号) 分页读取
+        doc_id 不为空时只导出该文档
+        """
+        self._require(collection_name)
+        doc_clause = "" if doc_id is None else "AND doc_id = ? "
+        doc_params = () if doc_id is None else (doc_id,)
+        last = (-1, -1)
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT COALESCE(chunk_index, row) AS ord, row, payload FROM points "
+                    f"WHERE collection = ? {doc_clause}AND (COALESCE(chunk_index, row), row) > (?, ?) "
+                    "ORDER BY ord, row LIMIT ?",
+                    (collection_name, *doc_params, *last, batch_size)
+                ).fetchall()
+            for _, _, payload in rows:
+                yield json.loads(payload).get("page_content", "")
+            if len(rows) < batch_size:
+                break
+            last = rows[-1][:2]
+
+    def _load_payloads(self, collection_name, point_ids):
+        """
+        批量读取 payload
+        """
+        payloads = {}
+        with self._lock:
+            for start in range(0, len(point_ids), _SQL_PARAMS_LIMIT):
+                group = point_ids[start:start + _SQL_PARAMS_LIMIT]
+                for point_id, payload in self.conn.execute(
+                        "SELECT point_id, payload FROM points "
+                        f"WHERE collection = ? AND point_id IN ({','.join('?' * len(group))})",
+                        [collection_name, *group]):
+                    payloads[point_id] = json.loads(payload)
+        return payloads
+
+    def _maybe_build_ivf(self, collection):
+        """
+        集合足够大时建立 IVF，新增行数较多时重建，调用方需持有锁
+        """
+        if not LOCAL_IVF_ENABLED or collection.points_count < LOCAL_IVF_MIN_POINTS:
+            collection.ivf = None
+            return
+        ivf = collection.ivf
+        if ivf is None or collection.rows > ivf.built_rows * (1 + _IVF_REBUILD_RATIO):
+            logger.info(f"建立IVF索引 | collection_name: {collection.name}, points_count: {collection.points_count}")
+            collection.ivf = _IvfIndex(collection.matrix(), collection.live)
+
+    def _maybe_compact(self, collection):
+        """
+        失效行过多时重写向量文件，只保留有效行，调用方需持有锁
+        """
+        dead_rows = collection.rows - collection.points_count
+        if dead_rows < _COMPACT_MIN_DEAD_ROWS or dead_rows * 2 < collection.rows:
+            return
+        live_rows = np.nonzero(collection.live)[0]
+        matrix = collection.matrix()
+        tmp_path = collection.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(live_rows), 8192):
+                f.write(np.asarray(matrix[live_rows[start:start + 8192]]).tobytes())
+        collection._matrix = None
+        os.replace(tmp_path, collection.path)
+
+        row_ids = [collection.row_ids[row] for row in live_rows]
+        row_docs = [collection.row_docs[row] for row in live_rows]
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE points SET row = ? WHERE collection = ? AND point_id = ?",
+                [(new_row, collection.name, point_id) for new_row, point_id in enumerate(row_ids)]
+            )
+        collection.row_ids = row_ids
+        collection.row_docs = row_docs
+        collection.id_to_row = {point_id: row for row, point_id in enumerate(row_ids)}
+        collection.live = np.ones(len(row_ids), dtype=bool)
+        collection.ivf = None
+        logger.info(f"压缩向量文件 | collection_name: {collection.name}, 清理失效行: {dead_rows}")
+
+
+if __name__ == "__main__":
+    # 测试
+    store = LocalVectorStore()
+    store.create_collection("test_collection")
+    store.add_points("test_collection", np.eye(4, store.size).tolist(),
+                     [{"page_content": str(i), "metadata": {"chunk_index": i}} for i in range(4)])
+    print(store.search("test_collection", np.eye(1, store.size)[0].tolist(), limit=2))
+    print(store.get_collection_content("test_collection"))
+    store.delete_collection("test_collection")
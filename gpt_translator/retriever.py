@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-16 20:52
+# @Desc   : 多集合并发检索与多路检索结果融合
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import math
+import heapq
+from itertools import islice
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List
+from loguru import logger
+
+from vector_store import BaseVectorStore, get_vector_store, DOC_ID_FIELD
+from config import QDRANT_SEARCH_TIMEOUT, QDRANT_SEARCH_MAX_WORKERS, RRF_K
+
+# 融合后的检索结果，score 为 RRF 分数
+FusedPoint = namedtuple("FusedPoint", ["id", "score", "payload"])
+
+# 进程内共享的检索线程池，避免每次提问都创建线程
+_search_executor = ThreadPoolExecutor(max_workers=QDRANT_SEARCH_MAX_WORKERS, thread_name_prefix="qdrant-search")
+
+
+def point_source(point):
+    """
+    节点所属文档的索引键：shared 模式下为 payload 中的 doc_id，per_file 模式下为检索时补上的集合名
+    """
+    return (point.payload or {}).get(DOC_ID_FIELD)
+
+
+def _tag_source(points, collection_name):
+    """
+    per_file 集合中的节点没有 doc_id，补上集合名，不同集合中 id 相同的节点才能区分
+    """
+    for point in points:
+        if point.payload is not None:
+            point.payload.setdefault(DOC_ID_FIELD, collection_name)
+    return points
+
+
+def search_collections(qdrant_db: BaseVectorStore,
+                       collection_names: List[str],
+                       query_vector: List[float],
+                       top_n: int,
+                       timeout: float = QDRANT_SEARCH_TIMEOUT) -> List:
+    """
+    并发检索多个集合，返回全局分数最高的 top_n 个 ScoredPoint。
+    每个集合返回的结果已按分数降序排列，用堆做 k 路归并，只取前 top_n 个。
+    超时或出错的集合会被跳过，不影响其他集合的结果；只检索一个集合时同样处理，不会抛出异常。
+    没有 doc_id 的节点以集合名作为 doc_id，见 point_source。
+    """
+    # 去重并保持顺序
+    collection_names = list(dict.fromkeys(collection_names))
+    if not collection_names or top_n <= 0:
+        return []
+
+    # Qdrant 接口的超时时间为整数秒，向上取整，避免小于 1 秒的超时变成 0
+    request_timeout = math.ceil(timeout)
+    futures = {
+        _search_executor.submit(qdrant_db.search, collection_name, query_vector, top_n, request_timeout): collection_name
+        for collection_name in collection_names
+    }
+    done, not_done = wait(futures, timeout=timeout)
+    for future in not_done:
+        future.cancel()
+        logger.warning(f"集合检索超时 | collection_name: {futures[future]} timeout: {timeout}s")
+
+    results = []
+    for future in done:
+        try:
+            results.append(_tag_source(future.result(), futures[future]))
+        except Exception as e:
+            logger.error(f"集合检索失败 | collection_name: {futures[future]} 错误信息: {e}")
+
+    merged = heapq.merge(*results, key=lambda point: point.score, reverse=True)
+    return list(islice(merged, top_n))
+
+
+def reciprocal_rank_fusion(result_lists: List[List], top_n: int, k: int = RRF_K) -> List[FusedPoint]:
+    """
+    倒数排名融合：节点的分数为其在各路结果中 1 / (k + 排名) 之和，排名从 1 开始。
+    只使用排名而不使用原始分数，余弦相似度和 BM25 分数的量纲不同也能直接融合。
+    节点按 (索引键, id) 区分，旧的 per_file 集合都使用 1..N 的整数 id，不同文档中 id 相同的节点不能合并。
+    """
+    scores = {}
+    points_by_key = {}
+    for points in result_lists:
+        for rank, point in enumerate(points, start=1):
+            key = (point_source(point), str(point.id))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            points_by_key.setdefault(key, point)
+    top = heapq.nlargest(top_n, scores.items(), key=lambda item: item[1])
+    return [
+        FusedPoint(id=str(points_by_key[key].id), score=score, payload=points_by_key[key].payload)
+        for key, score in top
+    ]
+
+
+if __name__ == "__main__":
+    # 测试
+    qdrant = get_vector_store()
+    collection_names = qdrant.list_all_collections_names()
+    print(search_collections(qdrant, collection_names, [0.1] * qdrant.size, top_n=3))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-29 20:40
+# @Desc   : 增量入库测试：替换文档时只对变化的块重新向量化，可直接运行或使用 pytest 运行
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import hashlib
+import tempfile
+
+from langchain.schema import Document
+from ingest_pipeline import IngestPipeline
+from local_vector_store import LocalVectorStore
+from lexical_index import LexicalIndex
+from document_manifest import DocumentManifest
+
+DIMENSION = 8
+COLLECTION_NAME = "doc"
+
+
+class FakeEmbeddingEngine:
+    """
+    记录每次向量化的文本，向量由文本哈希生成
+    """
+    def __init__(self):
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        return [[byte / 255 for byte in hashlib.md5(text.encode('utf-8')).digest()[:DIMENSION]] for text in texts]
+
+
+class FakeFileProcessorHelper:
+    """
+    每页即一个块，不经过解析和切分
+    """
+    def __init__(self, texts):
+        self.file_path = "fake.txt"
+        self.texts = texts
+
+    def iter_file_to_docs(self):
+        for text in self.texts:
+            yield Document(page_content=text, metadata={"page": 0})
+
+    def iter_split_docs(self, docs):
+        return docs
+
+
+class Store:
+    """
+    临时目录中的向量库和 BM25 索引，多个版本写入同一个集合
+    """
+    def __init__(self, store_dir):
+        self.vector_store = LocalVectorStore(store_dir=os.path.join(store_dir, "vectors"), dimension=DIMENSION)
+        self.vector_store.get_points_count(COLLECTION_NAME)
+        self.lexical_index = LexicalIndex(os.path.join(store_dir, "lexical.db"))
+
+    def ingest(self, texts, previous_chunks=None):
+        """
+        入库一个版本，返回 (流水线, 向量化引擎)
+        """
+        embedding_engine = FakeEmbeddingEngine()
+        pipeline = IngestPipeline(
+            self.vector_store,
+            embedding_engine=embedding_engine,
+            window_size=2,
+            lexical_index=self.lexical_index,
+        )
+        pipeline.run(COLLECTION_NAME, FakeFileProcessorHelper(texts), "doc_key", previous_chunks)
+        return pipeline, embedding_engine
+
+    def chunks(self):
+        """
+        集合中按块序号排列的块内容
+        """
+        payloads = [payload for _, _, payload in self.vector_store.iter_points(COLLECTION_NAME)]
+        return [payload['page_content'] for payload in sorted(payloads, key=lambda p: p['metadata']['chunk_index'])]
+
+
+def test_replace_embeds_only_changed_chunks():
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = Store(store_dir)
+        manifest = DocumentManifest(os.path.join(store_dir, "manifest.db"))
+        first, engine = store.ingest(["A", "B", "C", "D"])
+        assert engine.embedded == ["A", "B", "C", "D"]
+        manifest.save_document("doc_key", COLLECTION_NAME, "v1", first.chunks)
+
+        # 第二个版本修改了一个块并追加了一个块，上一版本的块记录从文档清单中读取
+        second, engine = store.ingest(["A", "B", "X", "D", "E"], manifest.get_chunks("doc_key"))
+        assert engine.embedded == ["X", "E"]
+        assert second.progress["chunks_reused"] == 3
+        assert second.progress["points_deleted"] == 1
+        assert store.chunks() == ["A", "B", "X", "D", "E"]
+
+
+def test_insert_at_front_reuses_shifted_chunks():
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = Store(store_dir)
+        first, _ = store.ingest(["A", "B", "C"])
+        # 后续块只有块序号变化，只更新 payload，不重新向量化也不重新写入
+        second, engine = store.ingest(["Z", "A", "B", "C"], first.chunks)
+        assert engine.embedded == ["Z"]
+        assert second.progress["points_upserted"] == 1
+        assert second.progress["points_deleted"] == 0
+        assert store.chunks() == ["Z", "A", "B", "C"]
+
+
+def test_unchanged_version_embeds_nothing():
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = Store(store_dir)
+        first, _ = store.ingest(["A", "A", "B"])
+        second, engine = store.ingest(["A", "A", "B"], first.chunks)
+        assert engine.embedded == []
+        assert second.progress["points_upserted"] == 0
+        assert second.chunks == first.chunks
+
+
+if __name__ == "__main__":
+    # 测试
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name} 通过")
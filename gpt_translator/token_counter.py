@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-12 19:48
+# @Desc   : token 计数，缓存编码器并支持批量计数
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from functools import lru_cache
+from typing import List
+
+import tiktoken
+from loguru import logger
+
+from config import TOKEN_ENCODING, TOKEN_COUNT_MEMO_SIZE, TOKEN_COUNT_MEMO_MAX_CHARS
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = TOKEN_ENCODING) -> tiktoken.Encoding:
+    """
+    获取编码器，每种编码/模型只加载一次。
+    name 既可以是编码名（cl100k_base），也可以是模型名（gpt-4o），无法识别时使用默认编码。
+    """
+    try:
+        return tiktoken.get_encoding(name)
+    except ValueError:
+        pass
+    try:
+        return tiktoken.encoding_for_model(name)
+    except KeyError:
+        logger.debug(f"未知的编码或模型，使用默认编码 | name: {name}, default: {TOKEN_ENCODING}")
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+
+
+@lru_cache(maxsize=TOKEN_COUNT_MEMO_SIZE)
+def _count_tokens_memo(text: str, name: str) -> int:
+    return len(get_encoding(name).encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str, name: str = TOKEN_ENCODING) -> int:
+    """
+    计算文本的 token 数，短文本的结果会被缓存
+    """
+    if len(text) > TOKEN_COUNT_MEMO_MAX_CHARS:
+        # 长文本（如完整 prompt）很少重复出现，不占用缓存
+        return len(get_encoding(name).encode(text, disallowed_special=()))
+    return _count_tokens_memo(text, name)
+
+
+def encode_batch(texts: List[str], name: str = TOKEN_ENCODING) -> List[List[int]]:
+    """
+    批量编码，由 tiktoken 在多个线程中并行执行
+    """
+    return get_encoding(name).encode_batch(texts, disallowed_special=())
+
+
+def count_tokens_batch(texts: List[str], name: str = TOKEN_ENCODING) -> List[int]:
+    """
+    批量计算 token 数
+    """
+    return [len(tokens) for tokens in encode_batch(texts, name)]
+
+
+if __name__ == "__main__":
+    # 测试
+    print(count_tokens("你好，世界！"))
+    print(count_tokens_batch(["你好，世界！", "kk_GPT 翻译器"]))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-13 20:35
+# @Desc   : 按 token 切分文本，每页只编码一次
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import copy
+from typing import List, Tuple
+from langchain.schema import Document
+
+from token_counter import get_encoding
+from config import CHUNK_SIZE, CHUNK_OVERLAP, TOKEN_ENCODING
+
+# 句子边界字符，切分点优先落在这些字符之后
+SENTENCE_ENDINGS = frozenset("\n。！？；…!?;.")
+
+
+class TokenTextSplitter:
+    def __init__(self,
+                 chunk_size: int = CHUNK_SIZE,
+                 chunk_overlap: int = CHUNK_OVERLAP,
+                 encoding_name: str = TOKEN_ENCODING,
+                 min_chunk_ratio: float = 0.5,
+                 ) -> None:
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding_name = encoding_name
+        # 向前寻找句子边界时，块长度不小于 chunk_size * min_chunk_ratio
+        self.min_chunk_tokens = max(1, int(chunk_size * min_chunk_ratio))
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        切分文本
+        """
+        return [chunk for chunk in (text[start:end].strip() for start, end in self.split_spans(text)) if chunk]
+
+    def split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """
+        切分文本，返回每个块在原文中的字符区间 [start, end)。
+        整段文本只编码一次，在 token 下标上确定切分点，再映射回字符下标。
+        """
+        encoding = get_encoding(self.encoding_name)
+        tokens = encoding.encode(text, disallowed_special=())
+        n = len(tokens)
+        if n <= self.chunk_size:
+            return [(0, len(text))] if text else []
+
+        # offsets[i] 为第 i 个 token 起始字符的下标，offsets[n] 为文本长度
+        _, offsets = encoding.decode_with_offsets(tokens)
+        offsets.append(len(text))
+
+        def is_boundary(i):
+            # 第 i 个 token 之前的字符是句子边界
+            return offsets[i] > 0 and text[offsets[i] - 1] in SENTENCE_ENDINGS
+
+        spans = []
+        start = 0
+        while True:
+            end = min(start + self.chunk_size, n)
+            if end < n:
+                for i in range(end, start + self.min_chunk_tokens, -1):
+                    if is_boundary(i):
+                        end = i
+                        break
+            spans.append((offsets[start], offsets[end]))
+            if end >= n:
+                break
+
+            # 下一块从重叠区间内的第一个句子开头开始，没有句子边界则从重叠区间起点开始
+            next_start = max(end - self.chunk_overlap, start + 1)
+            for i in range(next_start, end):
+                if is_boundary(i):
+                    next_start = i
+                    break
+            start = next_start
+        return spans
+
+    def create_documents(self, texts: List[str], metadatas: List[dict] = None) -> List[Document]:
+        """
+        切分文本并生成文档，每个块复制所在文本的 metadata
+        """
+        metadatas = metadatas or [{}] * len(texts)
+        docs = []
+        for text, metadata in zip(texts, metadatas):
+            for chunk in self.split_text(text):
+                docs.append(Document(page_content=chunk, metadata=copy.deepcopy(metadata)))
+        return docs
+
+
+if __name__ == "__main__":
+    # 测试
+    splitter = TokenTextSplitter(chunk_size=20, chunk_overlap=5)
+    for chunk in splitter.split_text("大模型的上下文窗口是有限的。所以需要对文档进行切分！切分后的文本块会被向量化；然后写入向量数据库。" * 3):
+        print(chunk)
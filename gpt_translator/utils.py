@@ -17,10 +17,39 @@ import time
 import traceback
 from loguru import logger
 from kk_GPT import kk_GPT
-from db_qdrant import QdrantDB
+from embedding_engine import EmbeddingEngine
+from ingest_pipeline import IngestPipeline, build_payloads
+from vector_store import get_vector_store
+from document_index import DocumentIndex
 from file_processor_helper import FileProcessorHelper
 from file_processor import FileProcessor
-from config import API_KEY, BASE_URL
+from file_registry import file_registry
+from document_manifest import get_document_manifest
+from context_packer import pack_context, trim_chat_history
+from answer_cache import make_scope
+from token_counter import count_tokens
+from config import (
+    API_KEY,
+    BASE_URL,
+    FILE_HASH_ALGORITHM,
+    DEFAULT_MODEL,
+    DEFAULT_MAX_TOKENS,
+    MODEL_TO_MAX_TOKENS,
+    PROMPT_RESERVED_TOKENS,
+    CHAT_HISTORY_MAX_RATIO,
+)
+
+# 文档问答的 prompt 模板
+DOCUMENT_PROMPT_TEMPLATE = """你是一位文档问答助手，你会基于`文档内容`和`对话历史`回答user的问题。如果用户的问题与`文档内容`无关，就不用强行根据`文档内容`回答。
+
+文档内容：```
+{context}```
+
+对话历史：```
+{chat_history}```
+
+user: ```{user_input}```
+assistant: """
 
 
 def create_result_dict(code, msg=None, data=None):
@@ -35,58 +64,94 @@ def create_result_dict(code, msg=None, data=None):
     return result
 
 
-def file_to_vectordb(file_path, file_name, file_extension, file_md5):
+def file_to_vectordb(file_path, file_name, file_extension, file_md5, progress_callback=None, doc_key=None):
     """
     将文件转换为向量数据库
+    文档默认以文件摘要作为标识，内容不同的文件（即使同名）都是独立的文档，互不影响；
+    调用方显式传入 doc_key 时视为替换该文档，只对变化的块做增量更新，写入该文档原有的索引键
+    文档清单中的 collection_name 记录的是索引键，per_file 模式下即集合名，shared 模式下为共享集合中的 doc_id
+    写入前在清单中标记集合，保存文档记录时清除；带有标记的集合是进程中途退出留下的，不视为已入库
     """
-    collection_name = file_md5
-    
     # 创建 Qdrant 类对象
-    qdrant = QdrantDB()
+    qdrant = get_vector_store()
+    document_index = DocumentIndex(qdrant)
+    manifest = get_document_manifest()
+    doc_key = doc_key or file_md5
     
     # This line is for testing delete_collection
     # qdrant.client.delete_collection(collection_name=collection_name)
     
-    # 获取集合里的数据数量 points_count，取值有三种情况: 0、>0、-1
-    points_count = qdrant.get_points_count(collection_name)
+    # case 0: 该版本的文件已入库
+    collection_name = manifest.find_collection(file_md5)
+    if collection_name and not manifest.is_pending(collection_name) and document_index.count(collection_name) > 0:
+        return file_path
     
-    if points_count == 0:
-        # case 1: 刚创建完集合，集合里没有节点
-        # 创建 FileProcessorHelper 类对象
-        file_processor_helper = FileProcessorHelper(
-            file_path=file_path,
-            file_name=file_name,
-            file_extension=file_extension,
-            file_md5=file_md5
-        )
+    previous_document = manifest.get_document(doc_key)
+    if previous_document and document_index.exists(previous_document['collection_name']):
+        # case 1: 替换已有文档，增量更新原有集合
+        collection_name = previous_document['collection_name']
+        previous_chunks = manifest.get_chunks(doc_key)
+        is_new_collection = False
+        logger.info(f"增量更新文档 | doc_key: {doc_key}, collection_name: {collection_name}, "
+                    f"旧版本: {previous_document['file_digest']}, 新版本: {file_md5}")
+    else:
+        collection_name = file_md5
+        owner = manifest.find_owner(collection_name)
+        if owner and owner != doc_key:
+            # 该集合已被其他文档增量更新为别的内容，换一个集合名
+            collection_name = f"{file_md5}_{FileProcessor.calculate_md5(doc_key)[:8]}"
         
-        # 获取 docs
-        docs = file_processor_helper.get_file_to_docs()
-        logger.trace(f"docs: {docs}")
+        if manifest.is_pending(collection_name):
+            # 上次写入未完成（进程中途退出），删除写了一半的文档后重新入库
+            logger.warning(f"删除未完成入库的文档 | collection_name: {collection_name}")
+            document_index.delete(collection_name)
+            manifest.clear_pending(collection_name)
         
-        # 切分 docs
-        docs = file_processor_helper.split_docs(docs)
-        texts = [doc.page_content for doc in docs]
-        metadatas = [doc.metadata for doc in docs]
-        
-        # 向量化 docs
-        payloads = build_payloads(texts, metadatas)
-        gpt = kk_GPT()
-        embeddings = gpt.get_embbeddings(texts)
-        # 插入节点
-        if qdrant.add_points(collection_name, embeddings, payloads):
+        # 获取集合里的数据数量 points_count，取值有三种情况: 0、>0、-1
+        points_count = document_index.prepare(collection_name)
+        if points_count > 0:
+            # case 2: 库里已有该集合，且该集合有节点（文档清单出现之前入库的集合）
             return file_path
-    elif points_count > 0:
-        # case 2: 库里已有该集合，且该集合有节点
-        return file_path
-    else:  # 等价于 points_count == -1
-        # case 3: `创建集合失败`或`获取集合信息时发生错误`
-        return ''   
+        elif points_count < 0:
+            # case 3: `创建集合失败`或`获取集合信息时发生错误`
+            return ''
+        # case 4: 刚创建完集合，集合里没有节点
+        previous_chunks = {}
+        is_new_collection = True
     
+    # 创建 FileProcessorHelper 类对象
+    file_processor_helper = FileProcessorHelper(
+        file_path=file_path,
+        file_name=file_name,
+        file_extension=file_extension,
+        file_md5=file_md5
+    )
     
-def upload_files(file_path):
+    # 流式入库：逐页解析、切分，分批向量化并写入
+    pipeline = IngestPipeline(qdrant, progress_callback=progress_callback)
+    target_collection, doc_id = document_index.target(collection_name)
+    manifest.mark_pending(collection_name, doc_key)
+    try:
+        chunks_count = pipeline.run(target_collection, file_processor_helper, doc_key, previous_chunks, doc_id)
+    except Exception:
+        if is_new_collection:
+            # 删除写了一半的文档，否则下次上传会被当作已入库
+            document_index.delete(collection_name)
+            manifest.clear_pending(collection_name)
+        raise
+    if not chunks_count:
+        if is_new_collection:
+            manifest.clear_pending(collection_name)
+        return ''
+    manifest.save_document(doc_key, collection_name, file_md5, pipeline.chunks, file_name)
+    return file_path
+    
+    
+def upload_files(file_path, progress_callback=None, doc_key=None):
     """
     上传文件
+    :param progress_callback: 入库进度回调，参数为进度字典
+    :param doc_key: 要替换的文档标识，为空时作为新文档入库
     """
     # 获取文件的更多信息
     try:
@@ -111,13 +176,13 @@ def upload_files(file_path):
         # 获取文件的更多信息
         file_name = file_processor.get_file_name()
         file_extension = file_processor.get_file_extension()
-        file_md5 = file_processor.get_file_md5()
+        file_md5 = get_collection_key(file_path)
         logger.info(
             f"文件信息 | file_name: {file_name}, file_extension: {file_extension}, file_md5: {file_md5}")
         
         # 文件插入向量数据库
         uploaded_file_path = file_to_vectordb(
-            file_path, file_name, file_extension, file_md5)
+            file_path, file_name, file_extension, file_md5, progress_callback, doc_key)
         
         # 处理成功
         if uploaded_file_path:
@@ -135,63 +200,101 @@ def upload_files(file_path):
         return create_result_dict(500)
 
 
-def build_chat_document_prompt(file_path_list, user_input, chat_history, top_n_number):
+def get_collection_key(file_path):
+    """
+    获取文件对应的集合名，并登记到文件登记表。
+    使用非 md5 摘要时，若新集合不存在而旧的 md5 集合存在，则沿用 md5 集合，避免重复入库。
+    """
+    collection_key = file_registry.get_digest(file_path)
+    if FILE_HASH_ALGORITHM == "md5":
+        return collection_key
+    
+    document_index = DocumentIndex()
+    if not document_index.exists(collection_key):
+        legacy_key = FileProcessor(file_path).get_file_md5()
+        if document_index.exists(legacy_key):
+            logger.info(f"沿用md5集合 | file_path: {file_path}, collection_name: {legacy_key}")
+            file_registry.register(file_path, legacy_key)
+            collection_key = legacy_key
+    return collection_key
+
+
+def get_question_vector(user_input):
+    """
+    获取问题向量，优先从向量缓存中获取，失败时返回 None
+    """
+    try:
+        question_vectors = EmbeddingEngine().embed([user_input])
+    except Exception as e:
+        logger.error(f"获取 question_vector 参数失败 | 错误信息: {e}")
+        return None
+    if not question_vectors:
+        logger.error("获取 question_vector 参数失败")
+        return None
+    return question_vectors[0]
+
+
+def get_answer_cache_scope(file_path_list, model):
+    """
+    获取答案缓存的范围：模型 + 文件摘要集合，上传时已登记摘要，未变化的文件不会重新计算
+    """
+    return make_scope(model, [file_registry.get_digest(file_path) for file_path in file_path_list])
+
+
+def build_chat_document_prompt(file_path_list, user_input, chat_history, top_n_number,
+                               model=DEFAULT_MODEL, max_tokens=DEFAULT_MAX_TOKENS, question_vector=None):
     """
     构建文档问答的prompt
+    question_vector 为空时在函数内向量化问题
+    prompt 的 token 数不超过模型上下文长度减去要生成的 max_tokens：
+    对话历史从最近一轮向前保留，最多占用可用预算的 CHAT_HISTORY_MAX_RATIO，剩余预算由文档内容填充
     """
     try:
         # 打印参数
-        logger.debug(f"fila_path: {file_path_list}, user_input: {user_input}, chat_history: {chat_history}, top_n: {top_n_number}")
-        # qdrant参数
-        qdrant_db = QdrantDB()
+        logger.debug(f"fila_path: {file_path_list}, user_input: {user_input}, chat_history: {chat_history}, "
+                     f"top_n: {top_n_number}, model: {model}, max_tokens: {max_tokens}")
+        
+        # token 预算
+        prompt_budget = MODEL_TO_MAX_TOKENS.get(model, MODEL_TO_MAX_TOKENS[DEFAULT_MODEL]) - int(max_tokens)
+        template_tokens = count_tokens(DOCUMENT_PROMPT_TEMPLATE.format(context="", chat_history="", user_input=user_input))
+        available_tokens = prompt_budget - template_tokens - PROMPT_RESERVED_TOKENS
+        if available_tokens <= 0:
+            logger.warning(f"max_tokens 过大，prompt 中没有空间放入文档内容 | model: {model}, max_tokens: {max_tokens}")
+        
+        # chat_history_str参数
+        chat_history_str = trim_chat_history(chat_history[:-1], int(available_tokens * CHAT_HISTORY_MAX_RATIO))
+        logger.trace(f"chat_history_str: \n{chat_history_str}")
+        context_tokens = available_tokens - count_tokens(chat_history_str)
+        
+        # 文档索引参数
+        document_index = DocumentIndex()
 
-        # collections_names参数
-        collection_names = []
-        for file_path in file_path_list:
-            file_bytes = FileProcessor.get_file_bytes(file_path)
-            file_md5 = FileProcessor.calculate_md5(file_bytes)
-            collection_names.append(file_md5)
+        # collections_names参数，上传时已登记摘要，未变化的文件不会重新计算
+        manifest = get_document_manifest()
+        collection_names = [
+            manifest.resolve_collection(file_registry.get_digest(file_path)) for file_path in file_path_list
+        ]
         logger.debug(f"collection_names: {collection_names}")
         
-        # question_vector参数
-        gpt = kk_GPT()
-        question_vectors = retry(gpt.get_embbeddings, args=([user_input]))
-        if not question_vectors:
-            logger.error("获取 question_vector 参数失败")
-            return ''
-        question_vector = question_vectors[0]
+        # question_vector参数，优先从向量缓存中获取
+        if question_vector is None:
+            question_vector = get_question_vector(user_input)
+            if question_vector is None:
+                return ''
         
         # context参数
         top_n = int(top_n_number)
         context = build_context(
-            qdrant_db,
+            document_index,
             collection_names,
             question_vector,
-            top_n)
+            top_n,
+            user_input,
+            context_tokens)
         logger.trace(f"context: \n{context}")
         
-        # chat_history_str参数
-        chat_history_str = ""
-        for chat in chat_history[:-1]:
-            # 检查是否是用户消息
-            if chat[0]:
-                chat_history_str += f'user:{chat[0]}\n'
-            if chat[1]:
-                chat_history_str += f'assistant:{chat[1]}\n'
-        chat_history_str = chat_history_str[:-1]  # 去掉最后一个'\n'
-        logger.trace(f"chat_history_str: \n{chat_history_str}")
-        
         # 构建 prompt
-        prompt = f"""你是一位文档问答助手，你会基于`文档内容`和`对话历史`回答user的问题。如果用户的问题与`文档内容`无关，就不用强行根据`文档内容`回答。
-
-文档内容：```
-{context}```
-
-对话历史：```
-{chat_history_str}```
-
-user: ```{user_input}```
-assistant: """
+        prompt = DOCUMENT_PROMPT_TEMPLATE.format(context=context, chat_history=chat_history_str, user_input=user_input)
         logger.info(f"prompt: \n{prompt}")
         return prompt
     except Exception as e:
@@ -200,15 +303,13 @@ assistant: """
         return ''
  
  
-def build_context(qdrant_db, collection_names, question_vector, top_n):
+def build_context(document_index, collection_names, question_vector, top_n, question=None, max_tokens=None):
     """
     构建上下文
+    检索结果去重、合并相邻块后在 max_tokens 内打包，未指定 max_tokens 时不限制长度
     """
-    scored_points = []
-    for collection_name in collection_names:
-        scored_points_by_current_collection = qdrant_db.search(
-            collection_name, question_vector, limit=top_n)
-        scored_points.extend(scored_points_by_current_collection)
+    # 检索所有文档，得到全局分数最高的 top_n 个节点，传入问题原文时与 BM25 检索结果融合
+    scored_points = document_index.search(collection_names, question_vector, top_n, query=question)
          
     # 将 ScoredPoint 对象列表转换为字典列表
     points = []
@@ -219,37 +320,14 @@ def build_context(qdrant_db, collection_names, question_vector, top_n):
             "payload": scored_point.payload
         }
         points.append(point)
-    
-    # 字典列表按分数降序排序
-    points.sort(key=lambda x: x['score'], reverse=True)
-    points = points[:top_n]
     logger.trace(f"points: {points}")
     
     # 构建上下文
-    contexts = []
-    for point in points:
-        context = point['payload']['page_content']
-        # metadata = point['payload']['metadata']
-        contexts.append(context)
-    context = "\n---\n".join(contexts)
+    context = pack_context(scored_points, max_tokens)
     
     return context
 
 
-def build_payloads(texts, metadatas):
-    """
-    构建payloads
-    """
-    payloads = []
-    for text, metadata in zip(texts, metadatas):
-        payload = {
-            'page_content': text,
-            'metadata': metadata
-        }
-        payloads.append(payload)
-    return payloads
-    
-    
 def retry(func, args=None, kwargs=None, retries=3, delay=1):
     """
     重试机制函数
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# --------------------------------------------------------
+# @Author : ${1:kkutysllb
+# @E-mail : libing1@sn.chinamobile.com, 31468130@qq.com
+# @Date   : 2025-01-20 20:18
+# @Desc   : 向量库接口，Qdrant 服务与进程内本地索引两种后端
+# --------------------------------------------------------
+"""
+import os
+import sys
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+import json
+import uuid
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+
+from config import VECTOR_STORE_BACKEND
+
+# 文档 id 字段，单集合多文档模式下用于按文档过滤
+DOC_ID_FIELD = "doc_id"
+
+# 节点 id 的命名空间，节点 id = uuid5(命名空间, 键)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3a52-8d4e-4b7a-9a0e-2f5b7c9d1e34")
+
+
+def make_point_id(*parts):
+    """
+    由若干键生成确定的节点 id，相同的键总是得到相同的 id
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, ":".join(str(part) for part in parts)))
+
+
+def hash_payload(payload):
+    """
+    计算 payload 哈希
+    """
+    payload_str = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(payload_str.encode('utf-8')).hexdigest()
+
+
+def payload_point_id(collection_name, payload):
+    """
+    由集合名和 payload 内容生成节点 id
+    """
+    return make_point_id(collection_name, hash_payload(payload))
+
+
+class BaseVectorStore(ABC):
+    """
+    向量库接口，各后端必须实现全部抽象方法，缺少方法的后端在实例化时即报错；调用方通过 get_vector_store() 获取实例，不依赖具体后端。
+    检索结果为带 id、score、payload 属性的对象，按分数降序排列。
+    """
+    size = None
+
+    @abstractmethod
+    def health_check(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_all_collections_names(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_points_count(self, collection_name):
+        """
+        集合存在时返回节点数，不存在时创建集合并返回 0，创建失败或出错时返回 -1
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_collection(self, collection_name):
+        raise NotImplementedError
+
+    @abstractmethod
+    def collection_exists(self, collection_name):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_collection(self, collection_name):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_points(self, collection_name, vectors, payloads, ids=None, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def retrieve_vectors(self, collection_name, ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_points(self, collection_name, ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_payloads(self, collection_name, ids, payloads):
+        """
+        覆盖指定节点的 payload，不改动向量
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, collection_name, query_vector, limit=3, timeout=None, search_params=None, doc_ids=None):
+        """
+        doc_ids 不为空时只检索 payload 中 doc_id 属于 doc_ids 的节点
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_points(self, collection_name, doc_id=None):
+        """
+        统计节点数，doc_id 不为空时只统计该文档的节点
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_document(self, collection_name, doc_id):
+        """
+        删除集合中某个文档的全部节点
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_points(self, collection_name, doc_id=None, **kwargs):
+        """
+        逐个产出集合中的 (节点id, 向量, payload)，doc_id 不为空时只产出该文档的节点
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_collection_content(self, collection_name, doc_id=None, **kwargs):
+        raise NotImplementedError
+
+    def get_collection_content(self, collection_name, doc_id=None):
+        """
+        获取集合中按块顺序拼接的完整文档内容，doc_id 不为空时只获取该文档
+        """
+        return "".join(self.iter_collection_content(collection_name, doc_id=doc_id))
+
+
+_local_vector_store = None
+_local_vector_store_lock = threading.Lock()
+
+
+def get_vector_store(backend=VECTOR_STORE_BACKEND) -> BaseVectorStore:
+    """
+    获取向量库实例
+    qdrant: 连接 Qdrant 服务，客户端在进程内共享
+    local: 进程内本地索引，整个进程共享同一个实例
+    """
+    global _local_vector_store
+    if backend == "local":
+        if _local_vector_store is None:
+            with _local_vector_store_lock:
+                if _local_vector_store is None:
+                    from local_vector_store import LocalVectorStore
+                    _local_vector_store = LocalVectorStore()
+        return _local_vector_store
+    if backend == "qdrant":
+        from db_qdrant import QdrantDB
+        return QdrantDB()
+    raise ValueError(f"Unsupported vector store backend: {backend}")
@@ -24,3 +24,11 @@ OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
 
 ZHIPUAI_API_KEY = os.getenv("ZHIPUAI_API_KEY")
 ZHIPUAI_API_BASE = os.getenv("ZHIPUAI_API_BASE")
+
+# 大模型客户端连接池配置，同一 (base_url, api_key) 在进程内共享一个客户端
+LLM_TIMEOUT = 600  # 读写超时时间（秒），与 OpenAI SDK 默认值一致，非流式长回复可能很久才返回首字节
+LLM_CONNECT_TIMEOUT = 10  # 建立连接的超时时间（秒）
+LLM_MAX_CONNECTIONS = 100  # 连接池最大连接数
+LLM_MAX_KEEPALIVE_CONNECTIONS = 20  # 保持长连接的最大连接数
+LLM_KEEPALIVE_EXPIRY = 60  # 空闲长连接的保持时间（秒）
+LLM_HTTP2 = True  # 安装了 h2 时使用 HTTP/2，多个请求复用同一个连接
@@ -10,8 +10,8 @@
 # --------------------------------------------------------
 """
 
-from openai import OpenAI
 from loguru import logger
+from llm_client import get_llm_client
 from config import LOCAL_API_KEY, LOCAL_API_BASE, LLM_MODELS, OPENAI_API_KEY, OPENAI_API_BASE, ZHIPUAI_API_BASE, ZHIPUAI_API_KEY
 
 def create_chat_response(message, model, temperature, max_tokens, frequency_penalty, presence_penalty, stream_value):
@@ -29,8 +29,8 @@ def create_chat_response(message, model, temperature, max_tokens, frequency_pena
         else:
             return "不支持的模型"
         
-        # 模型客户端实例化
-        client = OpenAI(api_key=api_key, base_url=base_url)
+        # 获取共享的模型客户端，同一服务的请求复用连接
+        client = get_llm_client(base_url, api_key)
         response = client.chat.completions.create(
             model=model,
             messages=message,